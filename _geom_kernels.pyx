@@ -0,0 +1,32 @@
+# cython: boundscheck=False, wraparound=False, cdivision=True
+"""
+Compiled polygon metric kernel for utils_file.polygon_metrics
+
+Build in place with: cythonize -i _geom_kernels.pyx
+"""
+
+from libc.math cimport cos, sqrt, fabs, M_PI
+
+cdef double KM_PER_DEG_LAT = 111.32
+
+cpdef tuple area_perimeter_km(double[:, ::1] coords, double lat):
+    """Return (area_km2, perimeter_km) of a closed ring of (lon, lat) coordinates"""
+    cdef Py_ssize_t i, n = coords.shape[0]
+    cdef double lat_f = KM_PER_DEG_LAT
+    cdef double lon_f = KM_PER_DEG_LAT * cos(lat * M_PI / 180.0)
+    cdef double x0 = coords[0, 0], y0 = coords[0, 1]
+    cdef double xa, ya, xb, yb, dx, dy
+    cdef double s = 0.0, p = 0.0
+
+    # Shoelace relative to the first vertex, as in the NumPy path
+    for i in range(n - 1):
+        xa = coords[i, 0] - x0
+        ya = coords[i, 1] - y0
+        xb = coords[i + 1, 0] - x0
+        yb = coords[i + 1, 1] - y0
+        s += xa * yb - xb * ya
+        dx = (xb - xa) * lon_f
+        dy = (yb - ya) * lat_f
+        p += sqrt(dx * dx + dy * dy)
+
+    return 0.5 * fabs(s) * lat_f * lon_f, p
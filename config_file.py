@@ -3,13 +3,24 @@
 Configuration file for Osmose processing pipeline
 """
 
+import os
+
 # Database Configuration
+# Read from the standard libpq environment variables so credentials stay out
+# of the source and the host/port can point at a PgBouncer endpoint
 DB_CONFIG = {
-    'host': 'host',
-    'port': 1234,
-    'database': 'database',
-    'user': 'user',
-    'password': 'password'
+    'host': os.environ.get('PGHOST', 'host'),
+    'port': int(os.environ.get('PGPORT', 1234)),
+    'database': os.environ.get('PGDATABASE', 'database'),
+    'user': os.environ.get('PGUSER', 'user'),
+    'password': os.environ.get('PGPASSWORD', '')
+}
+
+# Connection Pool Configuration
+POOL_CONFIG = {
+    'MIN_CONNECTIONS': 1,
+    'MAX_CONNECTIONS': 10,
+    'WAIT_TIMEOUT': 30
 }
 
 # Osmose API Configuration
@@ -21,7 +32,11 @@ OSMOSE_CONFIG = {
     'CLASS': 2,
     'FETCH_LIMIT': 500,  # Per API request
     'REQUEST_TIMEOUT': 30,
-    'REQUEST_DELAY': 0.5  # Seconds between requests
+    'REQUEST_DELAY': 0.5,  # Seconds between requests
+    'CONCURRENCY': 4,  # Pages fetched in parallel when aiohttp is installed
+    'COPY_CHUNK_SIZE': 1000,  # Rows buffered per COPY into the staging table
+    'PREFETCH_PAGES': 2,  # Pages fetched ahead while earlier ones are written
+    'INSERT_WORKERS': 4  # Chunks merged in parallel, each on its own pooled connection
 }
 
 # Patch Creation Configuration
@@ -33,7 +48,9 @@ PATCH_CONFIG = {
     'MIN_ERRORS_PER_PATCH': 3,
     'GRID_SIZE_KM': 4.0,
     'BUFFER_SIZE_KM': 1.0,
-    'DEFAULT_PATCH_SIZE_KM': 2.0
+    'DEFAULT_PATCH_SIZE_KM': 2.0,
+    'ERROR_FETCH_SIZE': 10000,  # Rows per round trip when streaming unprocessed errors
+    'N_JOBS': 1  # Processes building grid patches (-1: all cores)
 }
 
 # Logging Configuration
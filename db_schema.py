@@ -3,21 +3,163 @@
 Database schema creation script for Osmose processing pipeline
 """
 
-from utils import get_db_connection, close_db_connection, setup_logging
+from psycopg2 import sql
+from utils import get_db_connection, close_db_connection, setup_logging, ensure_batch_partition
 
 logger = setup_logging()
 
+# Index DDL, built CONCURRENTLY so reruns against populated tables don't block
+# writes. Each build is paired with the index name it creates; drops have None.
+INDEX_STATEMENTS = [
+    # SP-GiST is smaller and faster than GiST for point data. It gets its own
+    # name so existing installs build it and then drop their GiST index.
+    ('idx_osmose_errors_location_spgist', """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_osmose_errors_location_spgist 
+    ON osmose_errors USING SPGIST (location)
+    """),
+    (None, "DROP INDEX CONCURRENTLY IF EXISTS idx_osmose_errors_location"),
+    # Partial indexes split errors into unprocessed and assigned,
+    # replacing the full index on patch_id
+    (None, "DROP INDEX CONCURRENTLY IF EXISTS idx_osmose_errors_patch_id"),
+    ('idx_osmose_errors_patch_null', """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_osmose_errors_patch_null 
+    ON osmose_errors (error_id) WHERE patch_id IS NULL
+    """),
+    ('idx_osmose_errors_patch_assigned', """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_osmose_errors_patch_assigned 
+    ON osmose_errors (patch_id) WHERE patch_id IS NOT NULL
+    """),
+    ('idx_osmose_patches_geometry', """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_osmose_patches_geometry 
+    ON osmose_patches USING GIST (geometry)
+    """),
+    ('idx_osmose_patches_country', """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_osmose_patches_country 
+    ON osmose_patches (country_code)
+    """),
+    ('idx_osmose_patches_priority', """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_osmose_patches_priority 
+    ON osmose_patches (priority DESC)
+    """),
+    ('idx_osmose_patches_status', """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_osmose_patches_status 
+    ON osmose_patches (status)
+    """)
+]
+
+# Converts an import_batches table created before partitioning: the rows are
+# copied into a partitioned table with a partition per month they cover (and
+# the DEFAULT one), and batch_id keeps its sequence. Foreign keys pointing at
+# import_batches are dropped, since a partitioned table can only be referenced
+# through its full (batch_id, imported_at) key.
+MIGRATE_IMPORT_BATCHES = """
+    DO $$
+    DECLARE
+        month_start TIMESTAMP;
+        fk RECORD;
+    BEGIN
+        IF to_regclass('import_batches') IS NULL OR EXISTS (
+            SELECT 1 FROM pg_partitioned_table
+            WHERE partrelid = 'import_batches'::regclass
+        ) THEN
+            RETURN;
+        END IF;
+        
+        RAISE NOTICE 'Migrating import_batches to a partitioned table';
+        
+        FOR fk IN
+            SELECT conrelid::regclass AS tbl, conname
+            FROM pg_constraint
+            WHERE contype = 'f' AND confrelid = 'import_batches'::regclass
+        LOOP
+            EXECUTE format('ALTER TABLE %s DROP CONSTRAINT %I', fk.tbl, fk.conname);
+        END LOOP;
+        
+        ALTER TABLE import_batches RENAME TO import_batches_legacy;
+        ALTER INDEX IF EXISTS import_batches_pkey RENAME TO import_batches_legacy_pkey;
+        DROP INDEX IF EXISTS idx_batches_imported_at;
+        UPDATE import_batches_legacy SET imported_at = 'epoch' WHERE imported_at IS NULL;
+        
+        CREATE TABLE import_batches (
+            LIKE import_batches_legacy INCLUDING DEFAULTS,
+            PRIMARY KEY (batch_id, imported_at)
+        ) PARTITION BY RANGE (imported_at);
+        
+        -- The legacy table owns the batch_id sequence; hand it over before dropping
+        EXECUTE format(
+            'ALTER SEQUENCE %s OWNED BY import_batches.batch_id',
+            pg_get_serial_sequence('import_batches_legacy', 'batch_id')
+        );
+        
+        CREATE TABLE import_batches_default PARTITION OF import_batches DEFAULT;
+        FOR month_start IN
+            SELECT date_trunc('month', imported_at) FROM import_batches_legacy
+            WHERE imported_at <> 'epoch'
+            UNION
+            SELECT date_trunc('month', LOCALTIMESTAMP)
+        LOOP
+            EXECUTE format(
+                'CREATE TABLE %I PARTITION OF import_batches FOR VALUES FROM (%L) TO (%L)',
+                'import_batches_' || to_char(month_start, 'YYYY_MM'),
+                month_start,
+                month_start + INTERVAL '1 month'
+            );
+        END LOOP;
+        
+        INSERT INTO import_batches SELECT * FROM import_batches_legacy;
+        DROP TABLE import_batches_legacy;
+    END
+    $$;
+"""
+
+def drop_invalid_index(cur, index_name):
+    """Drop an index left INVALID by an interrupted concurrent build"""
+    # IF NOT EXISTS would otherwise skip it on every later run
+    cur.execute("""
+        SELECT 1 FROM pg_index
+        WHERE indexrelid = to_regclass(%s) AND NOT indisvalid
+    """, (index_name,))
+    
+    if cur.fetchone():
+        logger.warning(f"Rebuilding invalid index {index_name}")
+        cur.execute(sql.SQL("DROP INDEX CONCURRENTLY {}").format(sql.Identifier(index_name)))
+
+def create_indexes(conn):
+    """Create database indexes without blocking concurrent writes"""
+    # Note: CREATE INDEX CONCURRENTLY cannot be run inside a transaction,
+    # so each statement is sent on its own in autocommit mode
+    old_autocommit = conn.autocommit
+    conn.autocommit = True
+    
+    try:
+        with conn.cursor() as cur:
+            for index_name, statement in INDEX_STATEMENTS:
+                if index_name:
+                    drop_invalid_index(cur, index_name)
+                cur.execute(statement)
+                
+        logger.info("Created database indexes")
+        
+    finally:
+        conn.autocommit = old_autocommit
+
 def create_tables():
     """Create all required database tables"""
     conn = get_db_connection()
     
     try:
         with conn.cursor() as cur:
-            # Create import_batches table
+            # Existing installs still on an unpartitioned import_batches
+            cur.execute(MIGRATE_IMPORT_BATCHES)
+            
+            # Table DDL is sent as one multi-statement batch to avoid a
+            # round-trip per statement
             cur.execute("""
+                -- import_batches table, range-partitioned by month so old
+                -- batches can be removed by dropping whole partitions
                 CREATE TABLE IF NOT EXISTS import_batches (
-                    batch_id SERIAL PRIMARY KEY,
-                    imported_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    batch_id SERIAL,
+                    imported_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
                     imported_by VARCHAR(100) NOT NULL,
                     country_code VARCHAR(5) NOT NULL,
                     source_file VARCHAR(255),
@@ -26,13 +168,17 @@ def create_tables():
                     new_patches INTEGER DEFAULT 0,
                     duplicate_patches INTEGER DEFAULT 0,
                     failed_patches INTEGER DEFAULT 0,
-                    status VARCHAR(20) DEFAULT 'completed'
-                );
-            """)
-            logger.info("Created import_batches table")
-            
-            # Create osmose_errors table
-            cur.execute("""
+                    status VARCHAR(20) DEFAULT 'completed',
+                    PRIMARY KEY (batch_id, imported_at)
+                ) PARTITION BY RANGE (imported_at);
+
+                -- BRIN suits the append-only, time-ordered imported_at column.
+                -- Built here rather than CONCURRENTLY because that is not
+                -- supported on partitioned tables; the table is tiny anyway.
+                CREATE INDEX IF NOT EXISTS idx_batches_imported_at
+                ON import_batches USING BRIN (imported_at) WITH (pages_per_range = 32);
+
+                -- osmose_errors table
                 CREATE TABLE IF NOT EXISTS osmose_errors (
                     error_id VARCHAR(50) PRIMARY KEY,
                     patch_id VARCHAR(100),
@@ -47,22 +193,18 @@ def create_tables():
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                 );
-            """)
-            logger.info("Created osmose_errors table")
-            
-            # Create osmose_patches table
-            cur.execute("""
+
+                -- osmose_patches table
                 CREATE TABLE IF NOT EXISTS osmose_patches (
                     patch_id VARCHAR(100) PRIMARY KEY,
                     geometry GEOMETRY(Polygon, 4326) NOT NULL,
                     country_code VARCHAR(5) NOT NULL,
                     country_name VARCHAR(100),
-                    osmose_ids TEXT[] NOT NULL,
-                    area_km2 DECIMAL(10,3) NOT NULL,
-                    perimeter_km DECIMAL(10,3) NOT NULL,
+                    area_km2 DOUBLE PRECISION NOT NULL,
+                    perimeter_km DOUBLE PRECISION NOT NULL,
                     error_count INTEGER NOT NULL DEFAULT 0,
                     source_file VARCHAR(255),
-                    import_batch INTEGER REFERENCES import_batches(batch_id),
+                    import_batch INTEGER,
                     priority INTEGER DEFAULT 5,
                     difficulty VARCHAR(10) DEFAULT 'medium',
                     status VARCHAR(20) DEFAULT 'open',
@@ -72,53 +214,63 @@ def create_tables():
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                 );
+
+                -- Upgrades for older osmose_patches tables. Each ALTER takes an
+                -- ACCESS EXCLUSIVE lock, so only run it when there is work to do.
+                DO $$
+                BEGIN
+                    -- Patch membership lives in osmose_errors.patch_id
+                    IF EXISTS (
+                        SELECT 1 FROM information_schema.columns
+                        WHERE table_schema = current_schema()
+                        AND table_name = 'osmose_patches'
+                        AND column_name = 'osmose_ids'
+                    ) THEN
+                        ALTER TABLE osmose_patches DROP COLUMN osmose_ids;
+                    END IF;
+
+                    -- Native floats aggregate much faster than NUMERIC
+                    IF EXISTS (
+                        SELECT 1 FROM information_schema.columns
+                        WHERE table_schema = current_schema()
+                        AND table_name = 'osmose_patches'
+                        AND column_name IN ('area_km2', 'perimeter_km')
+                        AND data_type <> 'double precision'
+                    ) THEN
+                        ALTER TABLE osmose_patches
+                            ALTER COLUMN area_km2 TYPE DOUBLE PRECISION,
+                            ALTER COLUMN perimeter_km TYPE DOUBLE PRECISION;
+                    END IF;
+                END
+                $$;
             """)
-            logger.info("Created osmose_patches table")
-            
-            # Create indexes for better performance
-            cur.execute("""
-                CREATE INDEX IF NOT EXISTS idx_osmose_errors_location 
-                ON osmose_errors USING GIST (location);
-            """)
-            
-            cur.execute("""
-                CREATE INDEX IF NOT EXISTS idx_osmose_errors_patch_id 
-                ON osmose_errors (patch_id);
-            """)
-            
-            cur.execute("""
-                CREATE INDEX IF NOT EXISTS idx_osmose_patches_geometry 
-                ON osmose_patches USING GIST (geometry);
-            """)
-            
-            cur.execute("""
-                CREATE INDEX IF NOT EXISTS idx_osmose_patches_country 
-                ON osmose_patches (country_code);
-            """)
-            
-            cur.execute("""
-                CREATE INDEX IF NOT EXISTS idx_osmose_patches_priority 
-                ON osmose_patches (priority DESC);
-            """)
-            
-            cur.execute("""
-                CREATE INDEX IF NOT EXISTS idx_osmose_patches_status 
-                ON osmose_patches (status);
-            """)
-            
-            logger.info("Created database indexes")
-            
-            # Create foreign key constraint
+            ensure_batch_partition(cur)
+            logger.info("Created tables")
+            conn.commit()
+        
+        create_indexes(conn)
+        
+        with conn.cursor() as cur:
+            # Foreign key constraint (skipped if it already exists)
             cur.execute("""
-                ALTER TABLE osmose_errors 
-                ADD CONSTRAINT fk_osmose_errors_patch_id 
-                FOREIGN KEY (patch_id) REFERENCES osmose_patches(patch_id)
-                ON DELETE SET NULL;
+                DO $$
+                BEGIN
+                    IF NOT EXISTS (
+                        SELECT 1 FROM pg_constraint
+                        WHERE conname = 'fk_osmose_errors_patch_id'
+                    ) THEN
+                        ALTER TABLE osmose_errors 
+                        ADD CONSTRAINT fk_osmose_errors_patch_id 
+                        FOREIGN KEY (patch_id) REFERENCES osmose_patches(patch_id)
+                        ON DELETE SET NULL;
+                    END IF;
+                END
+                $$;
             """)
             logger.info("Added foreign key constraints")
-            
             conn.commit()
-            logger.info("Database schema created successfully")
+            
+        logger.info("Database schema created successfully")
             
     except Exception as e:
         logger.error(f"Failed to create database schema: {e}")
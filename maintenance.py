@@ -4,62 +4,144 @@ Maintenance and Cleanup Script for Osmose Processing Pipeline
 """
 
 import argparse
+import logging
 from datetime import datetime, timedelta
-from typing import List, Dict
-from psycopg2.extras import RealDictCursor
+from typing import List, Dict, Optional
+from psycopg2 import sql
+from psycopg2.pool import ThreadedConnectionPool
 
 from utils import get_db_connection, close_db_connection, setup_logging
 
 logger = setup_logging()
 
+# Everything the report needs comes back as one JSONB document. Sent as a
+# plain query rather than a session-level PREPARE, which doesn't survive
+# PgBouncer transaction pooling.
+STATS_QUERY = """
+    WITH e AS (
+        SELECT
+            COUNT(*) AS total,
+            COUNT(*) FILTER (WHERE patch_id IS NULL) AS unprocessed
+        FROM osmose_errors
+    ),
+    p AS (SELECT COUNT(*) AS total FROM osmose_patches),
+    b AS (SELECT COUNT(*) AS total FROM import_batches)
+    SELECT jsonb_build_object(
+        'total_errors', e.total,
+        'unprocessed_errors', e.unprocessed,
+        'total_patches', p.total,
+        'total_batches', b.total,
+        'patch_statistics', (
+            SELECT to_jsonb(ps) FROM (
+                SELECT
+                    AVG(area_km2) as avg_area,
+                    MIN(area_km2) as min_area,
+                    MAX(area_km2) as max_area,
+                    AVG(error_count) as avg_errors,
+                    MIN(error_count) as min_errors,
+                    MAX(error_count) as max_errors
+                FROM osmose_patches
+            ) ps
+        ),
+        'table_sizes', (
+            SELECT COALESCE(jsonb_agg(ts ORDER BY ts.bytes DESC), '[]'::jsonb) FROM (
+                SELECT
+                    t.tablename,
+                    s.bytes,
+                    pg_size_pretty(s.bytes) as size
+                FROM (VALUES
+                    ('osmose_errors'), ('osmose_patches'), ('import_batches')
+                ) t(tablename)
+                -- A partitioned parent stores nothing itself, so sum its
+                -- leaves; pg_partition_tree is empty for a plain table
+                CROSS JOIN LATERAL (
+                    SELECT COALESCE(
+                        SUM(pg_total_relation_size(pt.relid)),
+                        pg_total_relation_size(to_regclass('public.' || t.tablename))
+                    )::bigint as bytes
+                    FROM pg_partition_tree(to_regclass('public.' || t.tablename)) pt
+                    WHERE pt.isleaf
+                ) s
+                WHERE to_regclass('public.' || t.tablename) IS NOT NULL
+            ) ts
+        ),
+        'recent_batches', (
+            SELECT COALESCE(jsonb_agg(rb ORDER BY rb.imported_at DESC), '[]'::jsonb) FROM (
+                SELECT
+                    batch_id,
+                    imported_at,
+                    imported_by,
+                    new_patches,
+                    errors_count
+                FROM import_batches
+                ORDER BY imported_at DESC
+                LIMIT 10
+            ) rb
+        )
+    )
+    FROM e, p, b
+"""
+
 class MaintenanceManager:
     """Handles maintenance and cleanup operations"""
     
-    def __init__(self):
+    def __init__(self, pool: Optional[ThreadedConnectionPool] = None):
+        self.pool = pool
         self.conn = None
         
     def connect_db(self):
         """Connect to database"""
-        self.conn = get_db_connection()
+        self.conn = get_db_connection(self.pool)
         logger.info("Connected to database")
             
     def close_db(self):
         """Close database connection"""
         if self.conn:
-            close_db_connection(self.conn)
+            close_db_connection(self.conn, self.pool)
             
     def cleanup_old_batches(self, days_old: int = 30) -> int:
         """Remove import batches older than specified days"""
         cutoff_date = datetime.now() - timedelta(days=days_old)
         
         with self.conn.cursor() as cur:
-            # Get batches to delete
+            # Monthly partitions entirely older than the cutoff are dropped
+            # outright instead of being deleted row by row
+            cur.execute("""
+                SELECT c.relname
+                FROM pg_inherits i
+                JOIN pg_class c ON c.oid = i.inhrelid
+                WHERE i.inhparent = 'import_batches'::regclass
+                AND c.relname ~ '^import_batches_[0-9]{4}_[0-9]{2}$'
+                AND to_date(right(c.relname, 7), 'YYYY_MM') + INTERVAL '1 month' <= %s
+                ORDER BY c.relname
+            """, (cutoff_date,))
+            old_partitions = [row[0] for row in cur.fetchall()]
+            
+            deleted_count = 0
+            for partition in old_partitions:
+                # reltuples is -1 until a partition is analyzed, which idle
+                # old months rarely are, so count exactly; they are small
+                cur.execute(sql.SQL("SELECT COUNT(*) FROM {}").format(sql.Identifier(partition)))
+                partition_rows = cur.fetchone()[0]
+                deleted_count += partition_rows
+                cur.execute(sql.SQL("DROP TABLE {}").format(sql.Identifier(partition)))
+                logger.info(f"Dropped partition {partition} ({partition_rows} batches)")
+            
+            # Rows before the cutoff in the partially expired month and in
+            # the DEFAULT partition
             cur.execute("""
-                SELECT batch_id, imported_at, imported_by 
-                FROM import_batches 
+                DELETE FROM import_batches
                 WHERE imported_at < %s
-                ORDER BY imported_at
+                RETURNING batch_id
             """, (cutoff_date,))
-            
-            old_batches = cur.fetchall()
-            
-            if not old_batches:
+
+            deleted_count += len(cur.fetchall())
+            self.conn.commit()
+
+            if not (deleted_count or old_partitions):
                 logger.info(f"No batches older than {days_old} days found")
                 return 0
-            
-            logger.info(f"Found {len(old_batches)} batches to delete")
-            
-            # Delete old batches (cascading deletes will handle related records)
-            batch_ids = [batch[0] for batch in old_batches]
-            
-            cur.execute("""
-                DELETE FROM import_batches 
-                WHERE batch_id = ANY(%s)
-            """, (batch_ids,))
-            
-            deleted_count = cur.rowcount
-            self.conn.commit()
-            
+
             logger.info(f"Deleted {deleted_count} old import batches")
             return deleted_count
             
@@ -67,10 +149,13 @@ class MaintenanceManager:
         """Remove osmose_errors that reference non-existent patches"""
         with self.conn.cursor() as cur:
             cur.execute("""
-                UPDATE osmose_errors 
-                SET patch_id = NULL 
-                WHERE patch_id IS NOT NULL 
-                AND patch_id NOT IN (SELECT patch_id FROM osmose_patches)
+                UPDATE osmose_errors e
+                SET patch_id = NULL
+                WHERE e.patch_id IS NOT NULL
+                AND NOT EXISTS (
+                    SELECT 1 FROM osmose_patches p
+                    WHERE p.patch_id = e.patch_id
+                )
             """)
             
             updated_count = cur.rowcount
@@ -97,14 +182,7 @@ class MaintenanceManager:
     def delete_all_patches(self) -> int:
         """Delete all patches (for complete reset)"""
         with self.conn.cursor() as cur:
-            # First, unlink errors from patches
-            cur.execute("""
-                UPDATE osmose_errors 
-                SET patch_id = NULL 
-                WHERE patch_id IS NOT NULL
-            """)
-            
-            # Then delete all patches
+            # fk_osmose_errors_patch_id (ON DELETE SET NULL) unlinks the errors
             cur.execute("DELETE FROM osmose_patches")
             deleted_count = cur.rowcount
             
@@ -113,22 +191,28 @@ class MaintenanceManager:
             logger.info(f"Deleted all {deleted_count} patches")
             return deleted_count
             
-    def vacuum_database(self):
-        """Run VACUUM on all tables to reclaim space"""
+    def vacuum_database(self, cluster: bool = False):
+        """Run VACUUM on all tables to reclaim space, optionally clustering patches"""
         # Note: VACUUM cannot be run inside a transaction
         old_autocommit = self.conn.autocommit
         self.conn.autocommit = True
         
         try:
             with self.conn.cursor() as cur:
-                logger.info("Running VACUUM on osmose_errors...")
-                cur.execute("VACUUM ANALYZE osmose_errors")
-                
-                logger.info("Running VACUUM on osmose_patches...")
-                cur.execute("VACUUM ANALYZE osmose_patches")
+                if cluster:
+                    # Rewrite patches in spatial order so nearby geometries share
+                    # heap pages. Takes an ACCESS EXCLUSIVE lock on the table.
+                    # osmose_errors is not clustered: its SP-GiST location index
+                    # does not support CLUSTER.
+                    logger.info("Running CLUSTER on osmose_patches...")
+                    cur.execute("CLUSTER osmose_patches USING idx_osmose_patches_geometry")
                 
-                logger.info("Running VACUUM on import_batches...")
-                cur.execute("VACUUM ANALYZE import_batches")
+                # One command for all tables, with parallel index vacuuming (PG13+)
+                logger.info("Running VACUUM on osmose_errors, osmose_patches, import_batches...")
+                cur.execute("""
+                    VACUUM (ANALYZE, PARALLEL 4)
+                        osmose_errors, osmose_patches, import_batches
+                """)
                 
             logger.info("Database vacuum completed")
             
@@ -137,67 +221,25 @@ class MaintenanceManager:
             
     def get_database_stats(self) -> Dict:
         """Get comprehensive database statistics"""
-        with self.conn.cursor(cursor_factory=RealDictCursor) as cur:
-            stats = {}
-            
-            # Table sizes
-            cur.execute("""
-                SELECT 
-                    schemaname,
-                    tablename,
-                    pg_size_pretty(pg_total_relation_size(schemaname||'.'||tablename)) as size
-                FROM pg_tables 
-                WHERE schemaname = 'public' 
-                AND tablename IN ('osmose_errors', 'osmose_patches', 'import_batches')
-                ORDER BY pg_total_relation_size(schemaname||'.'||tablename) DESC
-            """)
-            stats['table_sizes'] = cur.fetchall()
-            
-            # Record counts
-            cur.execute("SELECT COUNT(*) as count FROM osmose_errors")
-            stats['total_errors'] = cur.fetchone()['count']
-            
-            cur.execute("SELECT COUNT(*) as count FROM osmose_errors WHERE patch_id IS NULL")
-            stats['unprocessed_errors'] = cur.fetchone()['count']
-            
-            cur.execute("SELECT COUNT(*) as count FROM osmose_patches")
-            stats['total_patches'] = cur.fetchone()['count']
-            
-            cur.execute("SELECT COUNT(*) as count FROM import_batches")
-            stats['total_batches'] = cur.fetchone()['count']
-            
-            # Patch statistics
-            cur.execute("""
-                SELECT 
-                    AVG(area_km2) as avg_area,
-                    MIN(area_km2) as min_area,
-                    MAX(area_km2) as max_area,
-                    AVG(error_count) as avg_errors,
-                    MIN(error_count) as min_errors,
-                    MAX(error_count) as max_errors
-                FROM osmose_patches
-            """)
-            patch_stats = cur.fetchone()
-            stats['patch_statistics'] = dict(patch_stats) if patch_stats['avg_area'] else {}
-            
-            # Recent activity
-            cur.execute("""
-                SELECT 
-                    batch_id,
-                    imported_at,
-                    imported_by,
-                    new_patches,
-                    errors_count
-                FROM import_batches 
-                ORDER BY imported_at DESC 
-                LIMIT 10
-            """)
-            stats['recent_batches'] = cur.fetchall()
-            
-            return stats
+        # Single round-trip; psycopg2 decodes the JSONB document to a dict
+        with self.conn.cursor() as cur:
+            cur.execute(STATS_QUERY)
+            stats = cur.fetchone()[0]
+
+        if not stats['patch_statistics']['avg_area']:
+            stats['patch_statistics'] = {}
+        for batch in stats['recent_batches']:
+            batch['imported_at'] = datetime.fromisoformat(batch['imported_at'])
+
+        return stats
             
     def print_database_report(self):
         """Print comprehensive database report"""
+        # Nothing below would be emitted, so skip the query and all formatting;
+        # past this check every line is logged, so f-strings cost nothing extra
+        if not logger.isEnabledFor(logging.INFO):
+            return
+        
         stats = self.get_database_stats()
         
         logger.info("="*60)
@@ -235,7 +277,7 @@ class MaintenanceManager:
         
         logger.info("="*60)
         
-    def run_maintenance(self, operations: List[str]):
+    def run_maintenance(self, operations: List[str], cluster: bool = False):
         """Run specified maintenance operations"""
         try:
             self.connect_db()
@@ -252,7 +294,7 @@ class MaintenanceManager:
                 elif operation == 'delete_patches':
                     self.delete_all_patches()
                 elif operation == 'vacuum':
-                    self.vacuum_database()
+                    self.vacuum_database(cluster=cluster)
                 elif operation == 'report':
                     self.print_database_report()
                 else:
@@ -275,12 +317,14 @@ Available Operations:
   remove_orphaned_errors - Clean up error references to deleted patches
   reset_errors         - Reset all errors to unprocessed state
   delete_patches       - Delete all patches (DESTRUCTIVE!)
-  vacuum              - Run VACUUM ANALYZE on all tables
+  vacuum              - Run VACUUM ANALYZE on all tables (add --cluster to
+                        also CLUSTER patches by geometry)
   report              - Generate database statistics report
 
 Examples:
   python maintenance.py --report
   python maintenance.py --operations cleanup_old_batches vacuum
+  python maintenance.py --operations vacuum --cluster
   python maintenance.py --operations reset_errors delete_patches --confirm
         """
     )
@@ -293,6 +337,9 @@ Examples:
     parser.add_argument('--report', action='store_true',
                        help='Generate database report only')
     
+    parser.add_argument('--cluster', action='store_true',
+                       help='CLUSTER osmose_patches by geometry during vacuum (locks the table)')
+    
     parser.add_argument('--confirm', action='store_true',
                        help='Required for destructive operations')
     
@@ -322,7 +369,7 @@ Examples:
     
     # Run maintenance
     manager = MaintenanceManager()
-    manager.run_maintenance(args.operations)
+    manager.run_maintenance(args.operations, cluster=args.cluster)
     
     logger.info("Maintenance completed successfully")
     return 0
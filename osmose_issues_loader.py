@@ -3,23 +3,170 @@
 Osmose Issues Loader - Fetches Osmose errors from API and stores in database
 """
 
+import asyncio
+import io
+import queue
+import struct
 import requests
+import threading
 import time
-from datetime import datetime
-from typing import List, Dict, Optional, Tuple
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from typing import AsyncIterator, Dict, Iterable, Iterator, List, Optional, Tuple
 from psycopg2.extras import RealDictCursor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
-from config import OSMOSE_CONFIG
-from utils import get_db_connection, close_db_connection, setup_logging
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+try:
+    import ciso8601
+except ImportError:
+    ciso8601 = None
+
+from config import OSMOSE_CONFIG, POOL_CONFIG
+from utils import get_db_connection, close_db_connection, setup_logging, ensure_batch_partition
 
 logger = setup_logging()
 
+_EWKB_POINT = struct.Struct('<BIIdd')
+_INT4 = struct.Struct('>i')
+_INT8 = struct.Struct('>q')
+_FIELD_COUNT = struct.pack('>h', 9)
+_NULL_FIELD = _INT4.pack(-1)
+_COPY_HEADER = b'PGCOPY\n\xff\r\n\x00' + struct.pack('>ii', 0, 0)
+_COPY_TRAILER = struct.pack('>h', -1)
+_PG_EPOCH = datetime(2000, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+
+def _ewkb_point(lon: float, lat: float) -> bytes:
+    """EWKB for a WGS84 point, so PostGIS reads it without calling ST_MakePoint"""
+    # Little-endian, Point type with the SRID flag (0x20000000) set, SRID 4326
+    return _EWKB_POINT.pack(1, 0x20000001, 4326, lon, lat)
+
+def _binary_field(value) -> bytes:
+    """Encode one value as a length-prefixed field of the COPY binary format"""
+    if value is None:
+        return _NULL_FIELD
+    if isinstance(value, str):
+        data = value.encode('utf-8')
+    elif isinstance(value, bytes):
+        data = value
+    elif isinstance(value, int):
+        data = _INT4.pack(value)
+    elif isinstance(value, datetime):
+        # TIMESTAMP is microseconds since 2000-01-01; like the text format,
+        # any UTC offset is dropped rather than converted
+        data = _INT8.pack((value.replace(tzinfo=None) - _PG_EPOCH) // _MICROSECOND)
+    else:
+        raise TypeError(f"Unsupported COPY value: {value!r}")
+    return _INT4.pack(len(data)) + data
+
+def _binary_row(row: Tuple) -> bytes:
+    """Encode a staging row for COPY ... WITH BINARY"""
+    return _FIELD_COUNT + b''.join(_binary_field(value) for value in row)
+
+def _fromisoformat(value: str) -> datetime:
+    """Parse an Osmose ISO 8601 timestamp, accepting a trailing 'Z'"""
+    if value.endswith('Z'):
+        value = value[:-1] + '+00:00'
+    return datetime.fromisoformat(value)
+
+# ciso8601 parses 'Z' directly in C; fall back to the stdlib without it
+_parse_date = ciso8601.parse_datetime if ciso8601 is not None else _fromisoformat
+
+_NUMBER = (int, float)
+
+# Retry policy shared by the requests session and the aiohttp page fetcher
+_RETRY_TOTAL = 5
+_RETRY_BACKOFF = 0.5
+_RETRY_STATUSES = (429, 502, 503, 504)
+
+def _retry_delay(attempt: int, retry_after: Optional[str] = None) -> float:
+    """Seconds to wait before retry number attempt + 1, honouring Retry-After"""
+    if retry_after:
+        try:
+            return max(float(retry_after), 0.0)
+        except ValueError:
+            pass
+    return _RETRY_BACKOFF * 2 ** attempt
+
+_DONE = object()
+
+def _prefetch(iterator: Iterator, depth: int) -> Iterator:
+    """Advance an iterator on a background thread, staying up to depth items ahead"""
+    items = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+    
+    def put(entry) -> bool:
+        # Give up once the consumer has gone away instead of blocking forever
+        while not stop.is_set():
+            try:
+                items.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+        
+    def produce():
+        try:
+            for item in iterator:
+                if not put((True, item)):
+                    break
+        except Exception as e:
+            put((False, e))
+        finally:
+            if hasattr(iterator, 'close'):
+                iterator.close()
+            put(_DONE)
+            
+    worker = threading.Thread(target=produce, daemon=True)
+    worker.start()
+    try:
+        while True:
+            entry = items.get()
+            if entry is _DONE:
+                break
+            ok, value = entry
+            if not ok:
+                raise value
+            yield value
+    finally:
+        stop.set()
+        worker.join()
+
 class OsmoseIssuesLoader:
     """Loads Osmose issues from API and stores them in database"""
     
     def __init__(self):
         self.conn = None
         self.batch_id = None
+        self.start_date = None
+        self.session = self._create_session()
+        
+    def _create_session(self) -> requests.Session:
+        """Create an HTTP session reusing connections, with retry and backoff"""
+        retry = Retry(
+            total=_RETRY_TOTAL,
+            backoff_factor=_RETRY_BACKOFF,
+            status_forcelist=list(_RETRY_STATUSES),
+            allowed_methods=['GET']
+        )
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=retry)
+        
+        session = requests.Session()
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
         
     def connect_db(self):
         """Connect to database"""
@@ -27,82 +174,234 @@ class OsmoseIssuesLoader:
         logger.info("Connected to database")
             
     def close_db(self):
-        """Close database connection"""
+        """Close database connection and HTTP session"""
         if self.conn:
             close_db_connection(self.conn)
+        self.session.close()
             
-    def fetch_osmose_errors(self, limit: Optional[int] = None) -> List[Dict]:
-        """Fetch Osmose errors from API"""
-        errors = []
-        
-        params = {
+    def _request_params(self) -> Dict:
+        """Build the Osmose API query parameters shared by every page request"""
+        return {
             'country': OSMOSE_CONFIG['COUNTRY_NAME'],
             'item': OSMOSE_CONFIG['ITEM'],
             'class': OSMOSE_CONFIG['CLASS'],
             'status': 'open',
-            'limit': OSMOSE_CONFIG['FETCH_LIMIT']
+            'limit': OSMOSE_CONFIG['FETCH_LIMIT'],
+            **({'start_date': self.start_date.isoformat()} if self.start_date else {})
         }
         
+    def iter_osmose_errors(self, limit: Optional[int] = None) -> Iterator[Dict]:
+        """Yield Osmose errors from the API as each page arrives"""
+        logger.info(f"Fetching Osmose errors for {OSMOSE_CONFIG['COUNTRY_NAME']}")
+        
+        if aiohttp is not None:
+            pages = self._iter_concurrent(limit)
+        else:
+            pages = self._iter_sequential(limit)
+            
+        # Fetch ahead on a background thread while the caller writes to the database
+        total_fetched = 0
+        for issues in _prefetch(pages, OSMOSE_CONFIG['PREFETCH_PAGES']):
+            total_fetched += len(issues)
+            yield from issues
+                
+        logger.info(f"Total errors fetched: {total_fetched}")
+        
+    def _iter_sequential(self, limit: Optional[int] = None) -> Iterator[List[Dict]]:
+        """Yield pages of Osmose errors one request at a time (fallback without aiohttp)"""
+        params = self._request_params()
         url = f"{OSMOSE_CONFIG['API_BASE']}/issues"
+        delay = OSMOSE_CONFIG['REQUEST_DELAY']
         page = 0
         total_fetched = 0
-        
-        logger.info(f"Fetching Osmose errors for {OSMOSE_CONFIG['COUNTRY_NAME']}")
+        next_request = time.monotonic()
         
         while True:
             try:
+                # Only wait out what's left of the delay after the caller's
+                # processing of the previous page
+                wait = next_request - time.monotonic()
+                if wait > 0:
+                    time.sleep(wait)
+                    
                 params['offset'] = page * params['limit']
                 
-                response = requests.get(
+                with self.session.get(
                     url, 
                     params=params, 
-                    timeout=OSMOSE_CONFIG['REQUEST_TIMEOUT']
-                )
-                response.raise_for_status()
-                
-                data = response.json()
-                issues = data.get('issues', [])
+                    timeout=OSMOSE_CONFIG['REQUEST_TIMEOUT'],
+                    stream=True
+                ) as response:
+                    response.raise_for_status()
+                    
+                    if ijson is not None:
+                        # Parse the body incrementally instead of loading the whole text
+                        response.raw.decode_content = True
+                        issues = list(ijson.items(response.raw, 'issues.item', use_float=True))
+                    else:
+                        issues = response.json().get('issues', [])
+                next_request = time.monotonic() + delay
                 
                 if not issues:
                     break
                     
-                errors.extend(issues)
+                if limit and total_fetched + len(issues) > limit:
+                    issues = issues[:limit - total_fetched]
+                    
                 total_fetched += len(issues)
-                
                 logger.info(f"Fetched {len(issues)} errors (total: {total_fetched})")
+                yield issues
                 
                 if limit and total_fetched >= limit:
-                    errors = errors[:limit]
                     break
                     
                 if len(issues) < params['limit']:
                     break
                     
                 page += 1
-                time.sleep(OSMOSE_CONFIG['REQUEST_DELAY'])
                 
             except requests.exceptions.RequestException as e:
+                # Raised rather than ending quietly, so the import isn't
+                # mistaken for a complete fetch
                 logger.error(f"API request failed: {e}")
-                break
+                raise
+        
+    async def _fetch_page(self, session, url: str, params: Dict, offset: int) -> List[Dict]:
+        """Fetch a single page of Osmose errors, retrying with backoff like the requests session"""
+        for attempt in range(_RETRY_TOTAL + 1):
+            retry_after = None
+            try:
+                async with session.get(url, params={**params, 'offset': offset}) as response:
+                    if response.status not in _RETRY_STATUSES or attempt == _RETRY_TOTAL:
+                        response.raise_for_status()
+                        data = await response.json()
+                        return data.get('issues', [])
+                    reason = f"HTTP {response.status}"
+                    retry_after = response.headers.get('Retry-After')
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                if attempt == _RETRY_TOTAL:
+                    raise
+                reason = str(e) or type(e).__name__
                 
-        logger.info(f"Total errors fetched: {len(errors)}")
-        return errors
+            delay = _retry_delay(attempt, retry_after)
+            logger.warning(f"API request at offset {offset} failed ({reason}), retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+        
+    def _iter_concurrent(self, limit: Optional[int] = None) -> Iterator[List[Dict]]:
+        """Drive the async page fetcher from a private event loop, one page at a time"""
+        loop = asyncio.new_event_loop()
+        pages = self._aiter_pages(limit)
+        
+        try:
+            while True:
+                try:
+                    issues = loop.run_until_complete(pages.__anext__())
+                except StopAsyncIteration:
+                    break
+                yield issues
+        finally:
+            loop.run_until_complete(pages.aclose())
+            loop.close()
+        
+    async def _aiter_pages(self, limit: Optional[int] = None) -> AsyncIterator[List[Dict]]:
+        """Yield pages of Osmose errors, requesting up to CONCURRENCY pages at a time"""
+        params = self._request_params()
+        page_size = params['limit']
+        url = f"{OSMOSE_CONFIG['API_BASE']}/issues"
+        concurrency = OSMOSE_CONFIG['CONCURRENCY']
+        delay = OSMOSE_CONFIG['REQUEST_DELAY']
+        page = 0
+        total_fetched = 0
+        next_request = time.monotonic()
         
-    def create_import_batch(self) -> str:
+        connector = aiohttp.TCPConnector(limit=concurrency)
+        timeout = aiohttp.ClientTimeout(total=OSMOSE_CONFIG['REQUEST_TIMEOUT'])
+        
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+            while True:
+                # Don't request more pages than the limit can still use
+                window = concurrency
+                if limit:
+                    window = min(window, -(-(limit - total_fetched) // page_size))
+                    
+                offsets = [(page + i) * page_size for i in range(window)]
+                
+                wait = next_request - time.monotonic()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                    
+                try:
+                    pages = await asyncio.gather(*(
+                        self._fetch_page(session, url, params, offset)
+                        for offset in offsets
+                    ))
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    logger.error(f"API request failed: {e}")
+                    raise
+                next_request = time.monotonic() + delay
+                    
+                # Pages come back in offset order; stop at the first short one
+                finished = False
+                for issues in pages:
+                    if not issues:
+                        finished = True
+                        break
+                        
+                    if limit and total_fetched + len(issues) > limit:
+                        issues = issues[:limit - total_fetched]
+                        
+                    total_fetched += len(issues)
+                    logger.info(f"Fetched {len(issues)} errors (total: {total_fetched})")
+                    yield issues
+                    
+                    if limit and total_fetched >= limit:
+                        finished = True
+                        break
+                        
+                    if len(issues) < page_size:
+                        finished = True
+                        break
+                        
+                if finished:
+                    break
+                    
+                page += window
+        
+    def get_last_import_date(self) -> Optional[date]:
+        """Get the date of the last complete API import for this country"""
+        with self.conn.cursor() as cur:
+            # A day of overlap covers server/API timezone differences;
+            # anything refetched is dropped by ON CONFLICT
+            cur.execute("""
+                SELECT (MAX(imported_at) - INTERVAL '1 day')::date
+                FROM import_batches
+                WHERE imported_by = 'osmose_api_loader'
+                  AND country_code = %s
+                  AND status = 'completed'
+                  AND errors_count > 0
+            """, (OSMOSE_CONFIG['COUNTRY_CODE'],))
+            return cur.fetchone()[0]
+            
+    def create_import_batch(self, partial: bool = False) -> str:
         """Create a new import batch record"""
         with self.conn.cursor() as cur:
+            ensure_batch_partition(cur)
             cur.execute("""
                 INSERT INTO import_batches (
                     imported_by,
                     country_code,
-                    source_file
+                    source_file,
+                    status
                 ) VALUES (
-                    %s, %s, %s
+                    %s, %s, %s, %s
                 ) RETURNING batch_id
             """, (
                 'osmose_api_loader',
                 OSMOSE_CONFIG['COUNTRY_CODE'],
-                f'osmose_api_{datetime.now().strftime("%Y%m%d_%H%M%S")}'
+                f'osmose_api_{datetime.now().strftime("%Y%m%d_%H%M%S")}',
+                # Limited runs never count as a baseline for incremental
+                # fetches; others are 'running' until insert_errors finishes
+                'partial' if partial else 'running'
             ))
             self.batch_id = cur.fetchone()[0]
             self.conn.commit()
@@ -110,37 +409,90 @@ class OsmoseIssuesLoader:
         logger.info(f"Created import batch: {self.batch_id}")
         return self.batch_id
         
-    def insert_errors(self, errors: List[Dict]) -> Tuple[int, int, int]:
-        """Insert errors into database"""
-        success_count = 0
-        duplicate_count = 0
-        error_count = 0
+    def _copy_rows(self, cur, rows: List[bytes]):
+        """COPY a chunk of encoded rows into the staging table"""
+        buffer = io.BytesIO()
+        buffer.write(_COPY_HEADER)
+        buffer.writelines(rows)
+        buffer.write(_COPY_TRAILER)
+        buffer.seek(0)
         
-        with self.conn.cursor() as cur:
-            for error in errors:
-                try:
-                    # Check for valid coordinates
-                    lat = error.get('lat')
-                    lon = error.get('lon')
-                    error_id = error.get('id')
-                    
-                    if not (lat and lon and error_id):
-                        error_count += 1
-                        logger.warning(f"Invalid error data: {error_id}")
-                        continue
-                    
-                    # Check for duplicates
-                    cur.execute("""
-                        SELECT COUNT(*) FROM osmose_errors 
-                        WHERE error_id = %s
-                    """, (str(error_id),))
-                    
-                    if cur.fetchone()[0] > 0:
-                        duplicate_count += 1
-                        continue
-                        
-                    # Insert error
-                    cur.execute("""
+        cur.copy_expert("""
+            COPY tmp_osmose (
+                error_id, location, item, class, title,
+                subtitle, username, error_timestamp, osmose_url
+            ) FROM STDIN WITH BINARY
+        """, buffer)
+        
+    def _update_batch_stats(self, cur, success_count: int, duplicate_count: int, error_count: int):
+        """Record insert counts on the current import batch"""
+        cur.execute("""
+            UPDATE import_batches
+            SET errors_count = %s,
+                new_patches = %s,
+                duplicate_patches = %s,
+                failed_patches = %s
+            WHERE batch_id = %s
+        """, (
+            success_count,
+            success_count,
+            duplicate_count,
+            error_count,
+            self.batch_id
+        ))
+        
+    def _set_batch_status(self, cur, status: str, current: Optional[str] = None):
+        """Set the status of the current import batch, only from current if given"""
+        cur.execute("""
+            UPDATE import_batches SET status = %s
+            WHERE batch_id = %s AND (%s IS NULL OR status = %s)
+        """, (status, self.batch_id, current, current))
+        
+    def _mark_failed(self):
+        """Record a failed import so it is never used as a watermark"""
+        if not (self.conn and self.batch_id):
+            return
+        try:
+            self.conn.rollback()
+            with self.conn.cursor() as cur:
+                self._set_batch_status(cur, 'failed')
+            self.conn.commit()
+        except Exception as e:
+            logger.error(f"Failed to mark batch {self.batch_id} as failed: {e}")
+            
+    def _insert_chunk(self, rows: List[bytes]) -> int:
+        """Stage and merge one chunk of encoded rows on its own pooled connection"""
+        # Other users of the pool may briefly hold every connection; wait for
+        # one rather than failing the chunk
+        conn = get_db_connection(wait=POOL_CONFIG['WAIT_TIMEOUT'])
+        try:
+            with conn.cursor() as cur:
+                # Each chunk commits on its own; don't wait on the WAL flush.
+                # The batch is only marked 'completed' by a later synchronous
+                # commit, which flushes these too, so a crash before it leaves
+                # the watermark where it was and the rows are fetched again.
+                cur.execute("SET LOCAL synchronous_commit = off")
+                
+                # Stream rows into a staging table with COPY, then merge them
+                # into osmose_errors in one statement. Duplicates of existing
+                # errors are skipped by ON CONFLICT.
+                cur.execute("""
+                    CREATE TEMP TABLE tmp_osmose (
+                        error_id VARCHAR(50),
+                        location GEOMETRY(Point, 4326),
+                        item INTEGER,
+                        class INTEGER,
+                        title TEXT,
+                        subtitle TEXT,
+                        username TEXT,
+                        error_timestamp TIMESTAMP,
+                        osmose_url TEXT
+                    ) ON COMMIT DROP
+                """)
+                self._copy_rows(cur, rows)
+                
+                cur.execute("""
+                    WITH inserted AS (
                         INSERT INTO osmose_errors (
                             error_id,
                             location,
@@ -151,75 +503,150 @@ class OsmoseIssuesLoader:
                             username,
                             error_timestamp,
                             osmose_url
-                        ) VALUES (
-                            %s,
-                            ST_SetSRID(ST_MakePoint(%s, %s), 4326),
-                            %s, %s, %s, %s, %s, %s, %s
                         )
-                    """, (
-                        str(error_id),
-                        lon, lat,
-                        error.get('item', OSMOSE_CONFIG['ITEM']),
-                        error.get('class', OSMOSE_CONFIG['CLASS']),
-                        error.get('title', 'Forest area without leaf_type'),
-                        error.get('subtitle', ''),
-                        error.get('username'),
-                        datetime.fromisoformat(error['date'].replace('Z', '+00:00')) 
-                            if error.get('date') else None,
-                        f"https://osmose.openstreetmap.fr/en/error/{error_id}"
-                    ))
-                    
-                    success_count += 1
-                    
-                    if success_count % 100 == 0:
-                        self.conn.commit()
-                        logger.info(f"Inserted {success_count} errors...")
-                    
-                except Exception as e:
-                    error_count += 1
-                    logger.error(f"Failed to insert error {error.get('id', 'unknown')}: {e}")
-                    continue
-                    
-            # Final commit
-            self.conn.commit()
+                        SELECT
+                            error_id,
+                            location, item, class, title, subtitle, username,
+                            error_timestamp, osmose_url
+                        FROM tmp_osmose
+                        ON CONFLICT (error_id) DO NOTHING
+                        RETURNING 1
+                    )
+                    SELECT COUNT(*) FROM inserted
+                """)
+                inserted = cur.fetchone()[0]
+            conn.commit()
+            return inserted
+            
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            close_db_connection(conn)
+            
+    def insert_errors(self, errors: Iterable[Dict]) -> Tuple[int, int, int]:
+        """Insert errors into database, merging chunks in parallel as they are fetched"""
+        success_count = 0
+        duplicate_count = 0
+        error_count = 0
+        chunk_size = OSMOSE_CONFIG['COPY_CHUNK_SIZE']
+        # The loader holds one pooled connection itself; leave it out
+        workers = max(1, min(OSMOSE_CONFIG['INSERT_WORKERS'], POOL_CONFIG['MAX_CONNECTIONS'] - 1))
+        rows = []
+        pending = deque()
+        
+        # Defaults looked up once rather than per row
+        item_default = OSMOSE_CONFIG['ITEM']
+        class_default = OSMOSE_CONFIG['CLASS']
+        title_default = 'Forest area without leaf_type'
+        url_prefix = "https://osmose.openstreetmap.fr/en/error/"
+        
+        # Local names for the per-row helpers
+        append_row = rows.append
+        encode_row = _binary_row
+        encode_point = _ewkb_point
+        parse_date = _parse_date
+        
+        failed_chunks = 0
+        
+        def collect(future, size: int):
+            nonlocal success_count, duplicate_count, error_count, failed_chunks
+            try:
+                inserted = future.result()
+                success_count += inserted
+                duplicate_count += size - inserted
+            except Exception as e:
+                error_count += size
+                failed_chunks += 1
+                logger.error(f"Failed to insert errors: {e}")
+                
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            stream_complete = True
+            try:
+                for error in errors:
+                    lat, lon, error_id = error.get('lat'), error.get('lon'), error.get('id')
                     
-        # Update batch statistics
+                    # Check for valid coordinates
+                    if not (lat and lon and error_id
+                            and isinstance(lat, _NUMBER) and isinstance(lon, _NUMBER)):
+                        error_count += 1
+                        logger.warning(f"Invalid error data: {error_id}")
+                        continue
+                        
+                    # A row that fails to parse or encode is skipped on its own
+                    try:
+                        error_date = error.get('date')
+                        row = encode_row((
+                            str(error_id),
+                            encode_point(lon, lat),
+                            int(error.get('item', item_default)),
+                            int(error.get('class', class_default)),
+                            error.get('title', title_default),
+                            error.get('subtitle', ''),
+                            error.get('username'),
+                            parse_date(error_date) if error_date else None,
+                            url_prefix + str(error_id)
+                        ))
+                    except Exception as e:
+                        error_count += 1
+                        logger.warning(f"Failed to encode error {error_id}: {e}")
+                        continue
+                        
+                    append_row(row)
+                    if len(rows) >= chunk_size:
+                        pending.append((executor.submit(self._insert_chunk, rows.copy()), len(rows)))
+                        rows.clear()
+                        
+                        # Keep a bounded number of chunks in flight
+                        if len(pending) > 2 * workers:
+                            collect(*pending.popleft())
+                            
+            except Exception as e:
+                # The error stream itself broke off; what was read is still merged
+                stream_complete = False
+                logger.error(f"Error stream stopped early: {e}")
+                
+            if rows:
+                pending.append((executor.submit(self._insert_chunk, rows.copy()), len(rows)))
+                rows.clear()
+                
+            while pending:
+                collect(*pending.popleft())
+                
+        logger.info(f"Inserted {success_count} errors")
+        
         with self.conn.cursor() as cur:
-            cur.execute("""
-                UPDATE import_batches
-                SET errors_count = %s,
-                    new_patches = %s,
-                    duplicate_patches = %s,
-                    failed_patches = %s
-                WHERE batch_id = %s
-            """, (
-                success_count,
-                success_count,
-                duplicate_count,
-                error_count,
-                self.batch_id
-            ))
-            self.conn.commit()
+            self._update_batch_stats(cur, success_count, duplicate_count, error_count)
+            # Only a fully fetched and merged stream moves the incremental
+            # watermark; a truncated stream or a failed chunk leaves it 'partial'
+            if stream_complete and not failed_chunks:
+                # Limited runs were created 'partial' and stay so
+                self._set_batch_status(cur, 'completed', current='running')
+            else:
+                self._set_batch_status(cur, 'partial')
+        self.conn.commit()
             
         return success_count, duplicate_count, error_count
         
     def get_summary_stats(self) -> Dict:
         """Get summary statistics of loaded data"""
         with self.conn.cursor(cursor_factory=RealDictCursor) as cur:
-            # Total errors
-            cur.execute("SELECT COUNT(*) as total_errors FROM osmose_errors")
+            # Total errors, from the planner estimate rather than a full scan
+            # (reltuples is -1 until the table has been analyzed)
+            cur.execute("""
+                SELECT GREATEST(reltuples, 0)::bigint as total_errors
+                FROM pg_class
+                WHERE oid = 'osmose_errors'::regclass
+            """)
             total_errors = cur.fetchone()['total_errors']
             
             # Errors by batch
             cur.execute("""
-                SELECT batch_id, COUNT(*) as error_count 
+                SELECT p.import_batch as batch_id, COUNT(*) as error_count 
                 FROM osmose_errors e
-                WHERE error_id IN (
-                    SELECT UNNEST(osmose_ids) 
-                    FROM osmose_patches 
-                    WHERE import_batch = %s
-                )
-                GROUP BY batch_id
+                JOIN osmose_patches p ON p.patch_id = e.patch_id
+                WHERE p.import_batch = %s
+                GROUP BY p.import_batch
             """, (self.batch_id,))
             
             batch_stats = cur.fetchall()
@@ -239,25 +666,34 @@ class OsmoseIssuesLoader:
                 'recent_batches': recent_batches
             }
             
-    def run(self, limit: Optional[int] = None):
+    def run(self, limit: Optional[int] = None, full_fetch: bool = False):
         """Run the complete import process"""
         try:
             self.connect_db()
-            self.create_import_batch()
             
-            # Fetch errors from API
-            errors = self.fetch_osmose_errors(limit)
+            # Only fetch issues newer than the last complete import
+            if not full_fetch:
+                self.start_date = self.get_last_import_date()
+                if self.start_date:
+                    logger.info(f"Fetching errors since {self.start_date}")
+                    
+            self.create_import_batch(partial=limit is not None)
+            
+            # Stream errors from the API straight into the database
+            errors = self.iter_osmose_errors(limit)
+            success, duplicates, failures = self.insert_errors(errors)
+            total_fetched = success + duplicates + failures
             
-            if not errors:
+            if not total_fetched:
+                if self.start_date:
+                    logger.info(f"No new errors since {self.start_date}")
+                    return self.batch_id
                 logger.warning("No errors fetched from API")
                 return
-                
-            # Insert errors into database
-            success, duplicates, failures = self.insert_errors(errors)
             
             # Print summary
             logger.info(f"\nImport Summary:")
-            logger.info(f"  Total errors fetched: {len(errors)}")
+            logger.info(f"  Total errors fetched: {total_fetched}")
             logger.info(f"  Successfully imported: {success}")
             logger.info(f"  Duplicates skipped: {duplicates}")
             logger.info(f"  Failed: {failures}")
@@ -266,12 +702,13 @@ class OsmoseIssuesLoader:
             # Get and display stats
             stats = self.get_summary_stats()
             logger.info(f"\nDatabase Stats:")
-            logger.info(f"  Total errors in database: {stats['total_errors']}")
+            logger.info(f"  Total errors in database (estimate): {stats['total_errors']}")
             
             return self.batch_id
             
         except Exception as e:
             logger.error(f"Import failed: {e}")
+            self._mark_failed()
             raise
         finally:
             self.close_db()
@@ -284,6 +721,7 @@ def main():
     parser = argparse.ArgumentParser(description='Load Osmose issues from API')
     parser.add_argument('--limit', type=int, help='Limit number of errors to fetch')
     parser.add_argument('--test', action='store_true', help='Run with small limit for testing')
+    parser.add_argument('--full-fetch', action='store_true', help='Fetch all open errors, not only those since the last import')
     
     args = parser.parse_args()
     
@@ -292,7 +730,7 @@ def main():
         limit = 100
         
     loader = OsmoseIssuesLoader()
-    batch_id = loader.run(limit=limit)
+    batch_id = loader.run(limit=limit, full_fetch=args.full_fetch)
     
     print(f"\nCompleted import with batch ID: {batch_id}")
 
@@ -3,32 +3,50 @@
 Patches Creator - Reads Osmose errors from database and creates patches
 """
 
+import csv
+import io
 import json
 import hashlib
+import logging
 import math
 from datetime import datetime
-from typing import List, Dict, Optional, Tuple
-from psycopg2.extras import RealDictCursor, Json
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from psycopg2.extras import RealDictCursor
 import numpy as np
+import shapely
+from joblib import Parallel, delayed
 from sklearn.cluster import DBSCAN
-from shapely.geometry import Point, Polygon, MultiPoint, box
+from shapely.geometry import Polygon, box, mapping
 from shapely.ops import unary_union
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 from config import OSMOSE_CONFIG, PATCH_CONFIG
 from utils import (
-    get_db_connection, close_db_connection, setup_logging,
-    km_to_degrees, calculate_area_km2, calculate_perimeter_km,
-    scale_polygon, calculate_priority, calculate_difficulty
+    get_db_connection, close_db_connection, setup_logging, ensure_batch_partition, stream_query,
+    km_to_degrees, polygon_metrics, scale_polygon, calculate_priority_batch, calculate_difficulty_batch
 )
 
 logger = setup_logging()
 
+EARTH_RADIUS_KM = 6371.0
+
+def _dumps(value) -> str:
+    """Serialize to JSON text, with orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(value, option=orjson.OPT_SERIALIZE_NUMPY).decode()
+    return json.dumps(value)
+
 class PatchesCreator:
     """Creates patches from Osmose errors stored in database"""
     
     def __init__(self):
         self.conn = None
         self.batch_id = None
+        self.loaded_errors = 0
         
     def connect_db(self):
         """Connect to database"""
@@ -40,43 +58,38 @@ class PatchesCreator:
         if self.conn:
             close_db_connection(self.conn)
             
-    def load_unprocessed_errors(self, country_code: Optional[str] = None) -> List[Dict]:
-        """Load errors that haven't been assigned to patches yet"""
-        with self.conn.cursor(cursor_factory=RealDictCursor) as cur:
-            query = """
-                SELECT 
-                    error_id,
-                    ST_X(location) as lon,
-                    ST_Y(location) as lat,
-                    item,
-                    class,
-                    title,
-                    subtitle,
-                    username,
-                    error_timestamp,
-                    osmose_url
-                FROM osmose_errors 
-                WHERE patch_id IS NULL
-            """
-            params = []
+    def load_unprocessed_errors(self, country_code: Optional[str] = None) -> Iterator[Dict]:
+        """Stream errors that haven't been assigned to patches yet"""
+        self.loaded_errors = 0
+        
+        query = """
+            SELECT 
+                error_id,
+                ST_X(location) as lon,
+                ST_Y(location) as lat
+            FROM osmose_errors 
+            WHERE patch_id IS NULL
+        """
+        params = []
+        
+        if country_code:
+            # Note: We don't have country_code in osmose_errors table
+            # This would need to be added if filtering by country is required
+            pass
             
-            if country_code:
-                # Note: We don't have country_code in osmose_errors table
-                # This would need to be added if filtering by country is required
-                pass
-                
-            cur.execute(query, params)
-            errors = cur.fetchall()
+        # Server-side cursor: rows arrive ERROR_FETCH_SIZE at a time as plain tuples
+        for error_id, lon, lat in stream_query(self.conn, query, params, PATCH_CONFIG['ERROR_FETCH_SIZE']):
+            self.loaded_errors += 1
+            yield {'error_id': error_id, 'lon': lon, 'lat': lat}
             
-        logger.info(f"Loaded {len(errors)} unprocessed errors")
-        return [dict(error) for error in errors]
+        logger.info(f"Loaded {self.loaded_errors} unprocessed errors")
         
-    def create_patches_from_errors(self, errors: List[Dict]) -> List[Dict]:
+    def create_patches_from_errors(self, errors: Iterable[Dict]) -> List[Dict]:
         """Create patches from error points using grid and clustering approach"""
-        if not errors:
-            return []
-            
-        error_points = []
+        # Keep only ids and one (N, 2) coordinate array; shapely geometries
+        # are built from slices of it when a patch needs them
+        ids = []
+        points = []
         
         for error in errors:
             lat = error.get('lat')
@@ -84,128 +97,176 @@ class PatchesCreator:
             error_id = error.get('error_id')
             
             if lat and lon and error_id:
-                error_points.append({
-                    'id': str(error_id),
-                    'lon': lon,
-                    'lat': lat,
-                    'point': Point(lon, lat),
-                    'error': error
-                })
+                ids.append(str(error_id))
+                points.append((lon, lat))
                 
-        if not error_points:
+        if not ids:
             logger.warning("No valid coordinates found")
             return []
             
-        logger.info(f"Creating patches from {len(error_points)} errors")
+        logger.info(f"Creating patches from {len(ids)} errors")
+        
+        error_ids = np.array(ids, dtype=object)
+        coords = np.array(points, dtype=np.float64)
         
         # Calculate grid size based on target area
-        avg_lat = np.mean([p['lat'] for p in error_points])
+        avg_lat = coords[:, 1].mean()
         grid_size_degrees = km_to_degrees(PATCH_CONFIG['GRID_SIZE_KM'], avg_lat)
         
-        patches = self._create_grid_patches(error_points, grid_size_degrees)
+        patches = self._create_grid_patches(error_ids, coords, grid_size_degrees)
         
         logger.info(f"Created {len(patches)} patches")
         return patches
         
-    def _create_grid_patches(self, error_points: List[Dict], grid_size: float) -> List[Dict]:
+    def _create_grid_patches(self, error_ids: np.ndarray, coords: np.ndarray,
+                             grid_size: float) -> List[Dict]:
         """Create patches using grid-based and clustering approach"""
-        if not error_points:
+        if not len(error_ids):
             return []
             
-        lons = [p['lon'] for p in error_points]
-        lats = [p['lat'] for p in error_points]
-        min_lon, max_lon = min(lons), max(lons)
-        min_lat, max_lat = min(lats), max(lats)
+        lons, lats = coords[:, 0], coords[:, 1]
+        min_lon, min_lat = lons.min(), lats.min()
         
         patches = []
         
-        # Grid-based patches
-        lat = min_lat
-        while lat < max_lat:
-            lon = min_lon
-            while lon < max_lon:
-                cell_polygon = box(lon, lat, lon + grid_size, lat + grid_size)
-                
-                cell_errors = []
-                for error_point in error_points:
-                    if cell_polygon.contains(error_point['point']):
-                        cell_errors.append(error_point)
-                
-                if len(cell_errors) >= PATCH_CONFIG['MIN_ERRORS_PER_PATCH']:
-                    patch = self._create_patch_from_errors(cell_errors, cell_polygon)
-                    if patch:
-                        patches.append(patch)
-                
-                lon += grid_size
-            lat += grid_size
+        # Grid-based patches: bin every point into its cell in one pass
+        # instead of testing each cell box against every point
+        nx = max(int(np.ceil((lons.max() - min_lon) / grid_size)), 1)
+        ny = max(int(np.ceil((lats.max() - min_lat) / grid_size)), 1)
+        ix = np.minimum(((lons - min_lon) / grid_size).astype(int), nx - 1)
+        iy = np.minimum(((lats - min_lat) / grid_size).astype(int), ny - 1)
+        
+        # Group point indices by cell, ordered row by row as before
+        cells, cell_of_point, counts = np.unique(
+            iy * nx + ix, return_inverse=True, return_counts=True
+        )
+        members = np.split(np.argsort(cell_of_point, kind='stable'), np.cumsum(counts)[:-1])
+        
+        # Build the boxes of all qualifying cells in one vectorized call
+        keep = counts >= PATCH_CONFIG['MIN_ERRORS_PER_PATCH']
+        cell_y, cell_x = np.divmod(cells[keep], nx)
+        cell_lons = min_lon + cell_x * grid_size
+        cell_lats = min_lat + cell_y * grid_size
+        cell_polygons = shapely.box(cell_lons, cell_lats, cell_lons + grid_size, cell_lats + grid_size)
+        
+        # Cells are independent, so build their patches in parallel. Workers
+        # get only id lists and coordinate slices to keep what is pickled small.
+        cell_members = (indices for indices, kept in zip(members, keep) if kept)
+        cell_patches = Parallel(n_jobs=PATCH_CONFIG['N_JOBS'])(
+            delayed(PatchesCreator._create_patch_from_errors)(
+                error_ids[indices].tolist(), coords[indices], cell_polygon
+            )
+            for cell_polygon, indices in zip(cell_polygons, cell_members)
+        )
+        patches.extend(patch for patch in cell_patches if patch)
         
         # Clustering-based patches for remaining points
-        coordinates = np.array([[p['lon'], p['lat']] for p in error_points])
-        eps_degrees = km_to_degrees(PATCH_CONFIG['CLUSTER_DISTANCE_KM'], np.mean(lats))
+        # Cluster on great-circle distance so eps is the same number of km at
+        # every latitude; a ball tree answers the haversine neighbour queries
+        clustering = DBSCAN(
+            eps=PATCH_CONFIG['CLUSTER_DISTANCE_KM'] / EARTH_RADIUS_KM,
+            min_samples=PATCH_CONFIG['MIN_ERRORS_PER_PATCH'],
+            algorithm='ball_tree',
+            metric='haversine'
+        )
+        labels = clustering.fit_predict(np.radians(coords[:, ::-1]))
+        
+        # Group clustered points by label (labels are numbered in order of
+        # discovery) and build every cluster hull in one vectorized call
+        clustered = np.flatnonzero(labels >= 0)
+        order = clustered[np.argsort(labels[clustered], kind='stable')]
+        cluster_members, cluster_hulls = [], []
         
-        clustering = DBSCAN(eps=eps_degrees, min_samples=PATCH_CONFIG['MIN_ERRORS_PER_PATCH'])
-        labels = clustering.fit_predict(coordinates)
+        if len(order):
+            _, cluster_sizes = np.unique(labels[order], return_counts=True)
+            cluster_members = np.split(order, np.cumsum(cluster_sizes)[:-1])
+            multipoints = shapely.multipoints(
+                coords[order], indices=np.repeat(np.arange(len(cluster_sizes)), cluster_sizes)
+            )
+            cluster_hulls = shapely.convex_hull(multipoints)
+            # Prepared once, reused by every intersects() test below
+            shapely.prepare(cluster_hulls)
         
-        clusters = {}
-        for idx, label in enumerate(labels):
-            if label >= 0:
-                if label not in clusters:
-                    clusters[label] = []
-                clusters[label].append(error_points[idx])
+        # Create patches from clusters, avoiding overlaps with grid patches.
+        # Grid patches are indexed once so each cluster is only compared
+        # against the few whose bounding boxes it touches.
+        grid_polygons = [patch['geometry'] for patch in patches]
+        grid_tree = shapely.STRtree(grid_polygons)
+        cluster_polygons = []
         
-        # Create patches from clusters, avoiding overlaps with grid patches
-        for cluster_id, cluster_errors in clusters.items():
-            cluster_points = [e['point'] for e in cluster_errors]
-            cluster_polygon = MultiPoint(cluster_points).convex_hull
+        for cluster_polygon, indices in zip(cluster_hulls, cluster_members):
+            candidates = [grid_polygons[i] for i in grid_tree.query(cluster_polygon, predicate='intersects')]
+            candidates.extend(p for p in cluster_polygons if cluster_polygon.intersects(p))
             
             # Check for overlap with existing patches
-            overlap = False
-            for existing_patch in patches:
-                existing_geom = existing_patch['geometry']
-                if isinstance(existing_geom, dict):
-                    from shapely.geometry import shape
-                    existing_polygon = shape(existing_geom)
-                else:
-                    existing_polygon = existing_geom
-                    
-                if cluster_polygon.intersects(existing_polygon):
-                    intersection_area = cluster_polygon.intersection(existing_polygon).area
-                    if intersection_area > 0.5 * cluster_polygon.area:
-                        overlap = True
-                        break
+            overlap = any(
+                self._mostly_covered(cluster_polygon, existing_polygon)
+                for existing_polygon in candidates
+            )
             
             if not overlap:
-                patch = self._create_patch_from_errors(cluster_errors)
+                patch = self._create_patch_from_errors(
+                    error_ids[indices].tolist(), coords[indices], hull=cluster_polygon
+                )
                 if patch:
                     patches.append(patch)
+                    cluster_polygons.append(patch['geometry'])
         
         return patches
         
-    def _create_patch_from_errors(self, error_points: List[Dict], 
-                                base_polygon: Optional[Polygon] = None) -> Optional[Dict]:
-        """Create a single patch from error points"""
+    @staticmethod
+    def _mostly_covered(hull, existing_polygon) -> bool:
+        """Whether more than half of a cluster hull lies inside an existing patch"""
+        if hull.area > 0:
+            return hull.intersection(existing_polygon).area > 0.5 * hull.area
+        # Identical or collinear errors give a point or line hull with no area
+        # to compare; measure lines by length and points by containment
+        if hull.length > 0:
+            return hull.intersection(existing_polygon).length > 0.5 * hull.length
+        return existing_polygon.covers(hull)
+        
+    @staticmethod
+    def _create_patch_from_errors(error_ids: List[str], coords: np.ndarray,
+                                  base_polygon: Optional[Polygon] = None,
+                                  hull: Optional[Polygon] = None) -> Optional[Dict]:
+        """Create a single patch from error ids and their (lon, lat) coordinates"""
         try:
-            if len(error_points) < PATCH_CONFIG['MIN_ERRORS_PER_PATCH']:
+            if len(error_ids) < PATCH_CONFIG['MIN_ERRORS_PER_PATCH']:
                 return None
                 
-            points = [e['point'] for e in error_points]
-            multipoint = MultiPoint(points)
+            metrics = None
+            centroid = None
             
             if base_polygon:
                 polygon = base_polygon
             else:
-                if len(points) >= 3:
-                    polygon = multipoint.convex_hull
-                    buffer_degrees = km_to_degrees(
-                        PATCH_CONFIG['BUFFER_SIZE_KM'], 
-                        multipoint.centroid.y
-                    )
-                    polygon = polygon.buffer(buffer_degrees)
+                if len(error_ids) >= 3:
+                    if hull is None:
+                        hull = shapely.convex_hull(shapely.multipoints(coords))
+                        
+                    # A hull that already meets the area bounds is used as is
+                    if hull.geom_type == 'Polygon':
+                        centroid = hull.centroid
+                        metrics = polygon_metrics(hull, lat=centroid.y)
+                        
+                    if metrics is not None and (
+                            PATCH_CONFIG['MIN_PATCH_AREA_KM2'] <= metrics['area_km2'] <= PATCH_CONFIG['MAX_PATCH_AREA_KM2']):
+                        polygon = hull
+                    else:
+                        # Buffer by the distance at the points' centroid latitude;
+                        # 4 segments per quarter circle is plenty for a patch outline
+                        buffer_degrees = km_to_degrees(
+                            PATCH_CONFIG['BUFFER_SIZE_KM'], 
+                            coords[:, 1].mean()
+                        )
+                        polygon = hull.buffer(buffer_degrees, quad_segs=4)
+                        metrics = None
+                        centroid = None
                 else:
                     # Create a box around points
-                    bounds = multipoint.bounds
-                    center_lon = (bounds[0] + bounds[2]) / 2
-                    center_lat = (bounds[1] + bounds[3]) / 2
+                    (min_lon, min_lat), (max_lon, max_lat) = coords.min(axis=0), coords.max(axis=0)
+                    center_lon = (min_lon + max_lon) / 2
+                    center_lat = (min_lat + max_lat) / 2
                     half_size = km_to_degrees(
                         PATCH_CONFIG['DEFAULT_PATCH_SIZE_KM'], 
                         center_lat
@@ -215,33 +276,39 @@ class PatchesCreator:
                         center_lon + half_size, center_lat + half_size
                     )
             
-            # Adjust polygon size if needed
-            area_km2 = calculate_area_km2(polygon)
-            
-            if area_km2 < PATCH_CONFIG['MIN_PATCH_AREA_KM2']:
-                scale_factor = math.sqrt(PATCH_CONFIG['TARGET_PATCH_AREA_KM2'] / area_km2)
-                polygon = scale_polygon(polygon, scale_factor)
-                area_km2 = calculate_area_km2(polygon)
-            elif area_km2 > PATCH_CONFIG['MAX_PATCH_AREA_KM2']:
+            # Adjust polygon size if needed. Scaling about the centroid by s
+            # multiplies the shoelace area by exactly s² and the perimeter by
+            # s, and leaves the centroid in place, so it is read once for the
+            # metrics, the scaling and the patch.
+            if centroid is None:
+                centroid = polygon.centroid
+            if metrics is None:
+                metrics = polygon_metrics(polygon, lat=centroid.y)
+            area_km2 = metrics['area_km2']
+            perimeter_km = metrics['perimeter_km']
+            
+            if not (PATCH_CONFIG['MIN_PATCH_AREA_KM2'] <= area_km2 <= PATCH_CONFIG['MAX_PATCH_AREA_KM2']):
                 scale_factor = math.sqrt(PATCH_CONFIG['TARGET_PATCH_AREA_KM2'] / area_km2)
-                polygon = scale_polygon(polygon, scale_factor)
-                area_km2 = calculate_area_km2(polygon)
-            
-            perimeter_km = calculate_perimeter_km(polygon)
-            
-            error_ids = [e['id'] for e in error_points]
-            errors = [e['error'] for e in error_points]
+                polygon = scale_polygon(polygon, scale_factor, centroid=centroid)
+                if metrics['projected']:
+                    # Scaling in degrees only multiplies the shoelace area by
+                    # exactly s², not the projected one, so measure it again
+                    metrics = polygon_metrics(polygon, lat=centroid.y)
+                    area_km2 = metrics['area_km2']
+                    perimeter_km = metrics['perimeter_km']
+                else:
+                    area_km2 = PATCH_CONFIG['TARGET_PATCH_AREA_KM2']
+                    perimeter_km *= scale_factor
             
             patch = {
-                'geometry': polygon.__geo_interface__,
+                'geometry': polygon,
                 'osmose_ids': sorted(error_ids),
                 'area_km2': round(area_km2, 3),
                 'perimeter_km': round(perimeter_km, 3),
                 'error_count': len(error_ids),
-                'errors': errors,
                 'centroid': {
-                    'lon': polygon.centroid.x,
-                    'lat': polygon.centroid.y
+                    'lon': centroid.x,
+                    'lat': centroid.y
                 }
             }
             
@@ -254,6 +321,7 @@ class PatchesCreator:
     def create_import_batch(self) -> str:
         """Create a new import batch for patches"""
         with self.conn.cursor() as cur:
+            ensure_batch_partition(cur)
             cur.execute("""
                 INSERT INTO import_batches (
                     imported_by,
@@ -273,106 +341,157 @@ class PatchesCreator:
         logger.info(f"Created patches batch: {self.batch_id}")
         return self.batch_id
         
+    def _update_batch_stats(self, cur, patches: List[Dict], success_count: int,
+                            duplicate_count: int, error_count: int):
+        """Record insert counts on the current patches batch"""
+        cur.execute("""
+            UPDATE import_batches
+            SET patches_count = %s,
+                errors_count = %s,
+                new_patches = %s,
+                duplicate_patches = %s,
+                failed_patches = %s
+            WHERE batch_id = %s
+        """, (
+            success_count + duplicate_count + error_count,
+            sum(len(p['osmose_ids']) for p in patches),
+            success_count,
+            duplicate_count,
+            error_count,
+            self.batch_id
+        ))
+        
     def insert_patches(self, patches: List[Dict]) -> Tuple[int, int, int]:
         """Insert patches into database and update error records"""
         success_count = 0
         duplicate_count = 0
         error_count = 0
         
+        patch_ids = [self._generate_patch_id(patch['osmose_ids']) for patch in patches]
+        source_file = f'patches_{OSMOSE_CONFIG["ITEM"]}'
+        
+        error_counts = np.array([patch['error_count'] for patch in patches])
+        areas = np.array([patch['area_km2'] for patch in patches], dtype=np.float64)
+        priorities = calculate_priority_batch(error_counts, areas).tolist()
+        difficulties = calculate_difficulty_batch(areas, error_counts).tolist()
+        
+        # Stage all patches with one COPY; the geometry travels as GeoJSON text
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for patch_id, patch, priority, difficulty in zip(patch_ids, patches, priorities, difficulties):
+            writer.writerow((
+                patch_id,
+                _dumps(mapping(patch['geometry'])),
+                OSMOSE_CONFIG['COUNTRY_CODE'],
+                OSMOSE_CONFIG['COUNTRY_NAME'],
+                patch['area_km2'],
+                patch['perimeter_km'],
+                patch['error_count'],
+                source_file,
+                self.batch_id,
+                priority,
+                difficulty,
+                _dumps({
+                    'created_date': datetime.now().isoformat(),
+                    'centroid': patch['centroid'],
+                    'source': 'patches_creator'
+                })
+            ))
+        buffer.seek(0)
+        
         with self.conn.cursor() as cur:
-            for patch in patches:
-                try:
-                    patch_id = self._generate_patch_id(patch['osmose_ids'])
-                    
-                    # Check for duplicates
-                    cur.execute("""
-                        SELECT COUNT(*) FROM osmose_patches 
-                        WHERE patch_id = %s
-                    """, (patch_id,))
-                    
-                    if cur.fetchone()[0] > 0:
-                        duplicate_count += 1
-                        continue
-                        
-                    # Insert patch
-                    cur.execute("""
-                        INSERT INTO osmose_patches (
-                            patch_id,
-                            geometry,
-                            country_code,
-                            country_name,
-                            osmose_ids,
-                            area_km2,
-                            perimeter_km,
-                            error_count,
-                            source_file,
-                            import_batch,
-                            priority,
-                            difficulty,
-                            metadata
-                        ) VALUES (
-                            %s,
-                            ST_SetSRID(ST_GeomFromGeoJSON(%s), 4326),
-                            %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s
-                        )
-                    """, (
+            try:
+                cur.execute("""
+                    CREATE TEMP TABLE tmp_patches (
+                        patch_id VARCHAR(100),
+                        geometry_json TEXT,
+                        country_code VARCHAR(5),
+                        country_name VARCHAR(100),
+                        area_km2 DOUBLE PRECISION,
+                        perimeter_km DOUBLE PRECISION,
+                        error_count INTEGER,
+                        source_file VARCHAR(255),
+                        import_batch INTEGER,
+                        priority INTEGER,
+                        difficulty VARCHAR(10),
+                        metadata JSONB
+                    ) ON COMMIT DROP
+                """)
+                
+                cur.copy_expert("""
+                    COPY tmp_patches (
+                        patch_id, geometry_json, country_code, country_name,
+                        area_km2, perimeter_km, error_count, source_file,
+                        import_batch, priority, difficulty, metadata
+                    ) FROM STDIN WITH (FORMAT csv)
+                """, buffer)
+                
+                # Existing patch ids are skipped and counted as duplicates
+                cur.execute("""
+                    INSERT INTO osmose_patches (
                         patch_id,
-                        json.dumps(patch['geometry']),
-                        OSMOSE_CONFIG['COUNTRY_CODE'],
-                        OSMOSE_CONFIG['COUNTRY_NAME'],
-                        patch['osmose_ids'],
-                        patch['area_km2'],
-                        patch['perimeter_km'],
-                        patch['error_count'],
-                        f'patches_{OSMOSE_CONFIG["ITEM"]}',
-                        self.batch_id,
-                        calculate_priority(patch['error_count'], patch['area_km2']),
-                        calculate_difficulty(patch['area_km2'], patch['error_count']),
-                        Json({
-                            'created_date': datetime.now().isoformat(),
-                            'centroid': patch['centroid'],
-                            'source': 'patches_creator'
-                        })
-                    ))
-                    
-                    # Update osmose_errors with patch_id
-                    for error_id in patch['osmose_ids']:
-                        cur.execute("""
-                            UPDATE osmose_errors 
-                            SET patch_id = %s, updated_at = CURRENT_TIMESTAMP
-                            WHERE error_id = %s
-                        """, (patch_id, error_id))
-                        
-                    success_count += 1
-                    self.conn.commit()
-                    
-                    logger.info(f"Inserted patch {patch_id}: {patch['area_km2']:.1f} km², {patch['error_count']} errors")
-                    
-                except Exception as e:
-                    error_count += 1
-                    logger.error(f"Failed to insert patch: {e}")
-                    self.conn.rollback()
-                    continue
-                    
-        # Update batch statistics
-        with self.conn.cursor() as cur:
-            cur.execute("""
-                UPDATE import_batches
-                SET patches_count = %s,
-                    errors_count = %s,
-                    new_patches = %s,
-                    duplicate_patches = %s,
-                    failed_patches = %s
-                WHERE batch_id = %s
-            """, (
-                success_count + duplicate_count + error_count,
-                sum(len(p['osmose_ids']) for p in patches),
-                success_count,
-                duplicate_count,
-                error_count,
-                self.batch_id
-            ))
-            self.conn.commit()
+                        geometry,
+                        country_code,
+                        country_name,
+                        area_km2,
+                        perimeter_km,
+                        error_count,
+                        source_file,
+                        import_batch,
+                        priority,
+                        difficulty,
+                        metadata
+                    )
+                    SELECT
+                        patch_id,
+                        ST_SetSRID(ST_GeomFromGeoJSON(geometry_json), 4326),
+                        country_code, country_name, area_km2, perimeter_km,
+                        error_count, source_file, import_batch, priority,
+                        difficulty, metadata
+                    FROM tmp_patches
+                    ON CONFLICT (patch_id) DO NOTHING
+                    RETURNING patch_id
+                """)
+                inserted = {row[0] for row in cur.fetchall()}
+                
+                # Assign errors to the inserted patches in one statement; an
+                # error in several patches keeps the last one, as before
+                assignments = {}
+                for patch_id, patch in zip(patch_ids, patches):
+                    if patch_id in inserted:
+                        for error_id in patch['osmose_ids']:
+                            assignments[error_id] = patch_id
+                            
+                cur.execute("""
+                    UPDATE osmose_errors e
+                    SET patch_id = m.patch_id, updated_at = CURRENT_TIMESTAMP
+                    FROM unnest(%s::text[], %s::text[]) AS m(error_id, patch_id)
+                    WHERE e.error_id = m.error_id
+                """, (list(assignments), list(assignments.values())))
+                
+                success_count = len(inserted)
+                duplicate_count = len(patches) - success_count
+                
+                # Patches, error assignments and batch statistics commit together
+                self._update_batch_stats(cur, patches, success_count, duplicate_count, error_count)
+                self.conn.commit()
+                
+                # Per-patch detail only when debugging; one line otherwise
+                if logger.isEnabledFor(logging.DEBUG):
+                    for patch_id, patch in zip(patch_ids, patches):
+                        if patch_id in inserted:
+                            logger.debug(f"Inserted patch {patch_id}: {patch['area_km2']:.1f} km², {patch['error_count']} errors")
+                logger.info(f"Inserted {success_count} patches")
+                
+            except Exception as e:
+                success_count = 0
+                duplicate_count = 0
+                error_count = len(patches)
+                logger.error(f"Failed to insert patches: {e}")
+                self.conn.rollback()
+                
+                self._update_batch_stats(cur, patches, success_count, duplicate_count, error_count)
+                self.conn.commit()
             
         return success_count, duplicate_count, error_count
         
@@ -389,45 +508,47 @@ class PatchesCreator:
                     short_ids.append(id_str)
             return f"{OSMOSE_CONFIG['COUNTRY_CODE']}_{'_'.join(short_ids)}"
         else:
-            hash_str = hashlib.md5('_'.join(sorted_ids).encode()).hexdigest()[:12]
+            hash_str = hashlib.blake2b('_'.join(sorted_ids).encode(), digest_size=6).hexdigest()
             return f"{OSMOSE_CONFIG['COUNTRY_CODE']}_MERGED_{len(sorted_ids)}_{hash_str}"
             
     def get_summary_stats(self) -> Dict:
         """Get summary statistics"""
         with self.conn.cursor(cursor_factory=RealDictCursor) as cur:
-            # Patch statistics
+            # Patch statistics, unprocessed errors and this batch's largest
+            # patches in one round trip
             cur.execute("""
-                SELECT 
-                    COUNT(*) as total_patches,
-                    AVG(area_km2) as avg_area,
-                    AVG(error_count) as avg_errors,
-                    SUM(error_count) as total_errors_in_patches
-                FROM osmose_patches
-            """)
-            patch_stats = cur.fetchone()
-            
-            # Unprocessed errors
-            cur.execute("""
-                SELECT COUNT(*) as unprocessed_errors 
-                FROM osmose_errors 
-                WHERE patch_id IS NULL
-            """)
-            unprocessed = cur.fetchone()
-            
-            # Recent patches from this batch
-            cur.execute("""
-                SELECT patch_id, error_count, area_km2, priority, difficulty
-                FROM osmose_patches
-                WHERE import_batch = %s
-                ORDER BY error_count DESC
-                LIMIT 5
+                WITH p AS (
+                    SELECT 
+                        COUNT(*) as total_patches,
+                        AVG(area_km2) as avg_area,
+                        AVG(error_count) as avg_errors,
+                        SUM(error_count) as total_errors_in_patches
+                    FROM osmose_patches
+                ), e AS (
+                    SELECT COUNT(*) as unprocessed_errors 
+                    FROM osmose_errors 
+                    WHERE patch_id IS NULL
+                ), s AS (
+                    SELECT COALESCE(json_agg(t ORDER BY t.error_count DESC), '[]') as sample_patches
+                    FROM (
+                        SELECT patch_id, error_count, area_km2, priority, difficulty
+                        FROM osmose_patches
+                        WHERE import_batch = %s
+                        ORDER BY error_count DESC
+                        LIMIT 5
+                    ) t
+                )
+                SELECT * FROM p CROSS JOIN e CROSS JOIN s
             """, (self.batch_id,))
-            sample_patches = cur.fetchall()
+            row = cur.fetchone()
             
             return {
-                'patch_stats': dict(patch_stats),
-                'unprocessed_errors': unprocessed['unprocessed_errors'],
-                'sample_patches': [dict(p) for p in sample_patches]
+                'patch_stats': {
+                    key: row[key]
+                    for key in ('total_patches', 'avg_area', 'avg_errors', 'total_errors_in_patches')
+                },
+                'unprocessed_errors': row['unprocessed_errors'],
+                'sample_patches': row['sample_patches']
             }
             
     def run(self, country_code: Optional[str] = None):
@@ -436,16 +557,14 @@ class PatchesCreator:
             self.connect_db()
             self.create_import_batch()
             
-            # Load unprocessed errors
+            # Stream unprocessed errors into patch creation
             errors = self.load_unprocessed_errors(country_code)
+            patches = self.create_patches_from_errors(errors)
             
-            if not errors:
+            if not self.loaded_errors:
                 logger.warning("No unprocessed errors found")
                 return
                 
-            # Create patches
-            patches = self.create_patches_from_errors(errors)
-            
             if not patches:
                 logger.warning("No patches created")
                 return
@@ -455,7 +574,7 @@ class PatchesCreator:
             
             # Print summary
             logger.info(f"\nPatches Creation Summary:")
-            logger.info(f"  Errors processed: {len(errors)}")
+            logger.info(f"  Errors processed: {self.loaded_errors}")
             logger.info(f"  Patches created: {len(patches)}")
             logger.info(f"  Successfully imported: {success}")
             logger.info(f"  Duplicates skipped: {duplicates}")
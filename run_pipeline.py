@@ -7,7 +7,7 @@ import argparse
 import sys
 from datetime import datetime
 
-from utils import setup_logging
+from utils import setup_logging, shutdown_pool
 from osmose_issues_loader import OsmoseIssuesLoader
 from patches_creator import PatchesCreator
 
@@ -250,7 +250,8 @@ Examples:
     elif args.patches_only:
         success = run_patches_only(country_code=args.country)
     
-    # Exit with appropriate code
+    # Release pooled connections, then exit with appropriate code
+    shutdown_pool()
     sys.exit(0 if success else 1)
 
 if __name__ == "__main__":
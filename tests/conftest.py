@@ -0,0 +1,11 @@
+"""
+Test setup: the scripts import each other as config and utils
+"""
+
+import importlib
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.modules.setdefault('config', importlib.import_module('config_file'))
+sys.modules.setdefault('utils', importlib.import_module('utils_file'))
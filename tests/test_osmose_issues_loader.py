@@ -0,0 +1,240 @@
+"""
+Tests for staging Osmose errors: COPY binary encoding and insert_errors
+"""
+
+import asyncio
+import struct
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+
+import pytest
+import shapely
+
+import osmose_issues_loader
+from osmose_issues_loader import (
+    OsmoseIssuesLoader, _COPY_HEADER, _COPY_TRAILER, _binary_field, _binary_row, _ewkb_point
+)
+
+
+def decode_rows(data: bytes):
+    """Decode a COPY binary stream back into rows of raw field bytes"""
+    assert data[:11] == b'PGCOPY\n\xff\r\n\x00'
+    flags, extension_length = struct.unpack('>ii', data[11:19])
+    assert (flags, extension_length) == (0, 0)
+    
+    rows = []
+    offset = 19
+    while True:
+        (field_count,) = struct.unpack('>h', data[offset:offset + 2])
+        offset += 2
+        if field_count == -1:
+            break
+        row = []
+        for _ in range(field_count):
+            (length,) = struct.unpack('>i', data[offset:offset + 4])
+            offset += 4
+            if length == -1:
+                row.append(None)
+            else:
+                row.append(data[offset:offset + length])
+                offset += length
+        rows.append(row)
+        
+    assert offset == len(data)
+    return rows
+
+
+def test_ewkb_point_round_trip():
+    point = shapely.from_wkb(_ewkb_point(71.4305, 51.1283))
+    
+    assert point.geom_type == 'Point'
+    assert (point.x, point.y) == (71.4305, 51.1283)
+    assert shapely.get_srid(point) == 4326
+
+
+def test_header_and_trailer():
+    assert _COPY_HEADER == b'PGCOPY\n\xff\r\n\x00' + b'\x00' * 8
+    assert _COPY_TRAILER == b'\xff\xff'
+    assert decode_rows(_COPY_HEADER + _COPY_TRAILER) == []
+
+
+def test_null_field():
+    assert _binary_field(None) == b'\xff\xff\xff\xff'
+
+
+def test_row_round_trip():
+    timestamp = datetime(2024, 5, 17, 8, 30, 15, 250)
+    row = (
+        '12345', _ewkb_point(70.5, 48.25), 1234, 7, 'Title ü',
+        '', None, timestamp, 'https://osmose.openstreetmap.fr/en/error/12345'
+    )
+    
+    (fields,) = decode_rows(_COPY_HEADER + _binary_row(row) + _COPY_TRAILER)
+    
+    assert len(fields) == 9
+    assert fields[0].decode('utf-8') == '12345'
+    assert shapely.from_wkb(fields[1]).coords[0] == (70.5, 48.25)
+    assert struct.unpack('>i', fields[2])[0] == 1234
+    assert struct.unpack('>i', fields[3])[0] == 7
+    assert fields[4].decode('utf-8') == 'Title ü'
+    assert fields[5] == b''
+    assert fields[6] is None
+    
+    # TIMESTAMP is microseconds since 2000-01-01
+    (micros,) = struct.unpack('>q', fields[7])
+    assert micros == int((timestamp - datetime(2000, 1, 1)).total_seconds()) * 10**6 + 250
+    assert fields[8].decode('utf-8').endswith('/12345')
+
+
+def test_aware_timestamp_keeps_wall_clock():
+    aware = datetime(2024, 1, 1, 12, tzinfo=timezone(timedelta(hours=5)))
+    
+    assert _binary_field(aware) == _binary_field(datetime(2024, 1, 1, 12))
+
+
+@pytest.fixture
+def loader(monkeypatch):
+    """A loader whose chunks 'insert' every row, with the database mocked out"""
+    monkeypatch.setitem(osmose_issues_loader.OSMOSE_CONFIG, 'COPY_CHUNK_SIZE', 3)
+    monkeypatch.setattr(OsmoseIssuesLoader, '_insert_chunk', lambda self, rows: len(rows))
+    loader = OsmoseIssuesLoader()
+    loader.conn = mock.MagicMock()
+    loader.batch_id = 1
+    return loader
+
+
+def make_issues(count: int):
+    return [
+        {'id': i, 'lat': 48.0 + i * 0.01, 'lon': 70.0 + i * 0.01, 'date': '2024-01-01T00:00:00Z'}
+        for i in range(1, count + 1)
+    ]
+
+
+def test_bad_row_is_skipped_not_fatal(loader):
+    issues = make_issues(11)
+    issues[4]['date'] = 'not a date'
+    
+    assert loader.insert_errors(iter(issues)) == (10, 0, 1)
+
+
+@pytest.fixture
+def statuses(monkeypatch):
+    """Statuses insert_errors writes to the batch, in order"""
+    written = []
+    monkeypatch.setattr(
+        OsmoseIssuesLoader, '_set_batch_status',
+        lambda self, cur, status, current=None: written.append(status)
+    )
+    return written
+
+
+def test_complete_stream_marks_batch_completed(loader, statuses):
+    loader.insert_errors(iter(make_issues(7)))
+    
+    assert statuses == ['completed']
+
+
+def test_broken_stream_marks_batch_partial(loader, statuses):
+    def issues():
+        yield from make_issues(4)
+        raise RuntimeError("API request failed")
+        
+    assert loader.insert_errors(issues()) == (4, 0, 0)
+    assert statuses == ['partial']
+
+
+def test_failed_chunk_marks_batch_partial(loader, statuses, monkeypatch):
+    def insert_chunk(self, rows):
+        raise RuntimeError("connection lost")
+        
+    monkeypatch.setattr(OsmoseIssuesLoader, '_insert_chunk', insert_chunk)
+    
+    assert loader.insert_errors(iter(make_issues(5))) == (0, 0, 5)
+    assert statuses == ['partial']
+
+
+aiohttp = osmose_issues_loader.aiohttp
+needs_aiohttp = pytest.mark.skipif(aiohttp is None, reason="aiohttp not installed")
+
+
+class FakeResponse:
+    def __init__(self, status, issues=(), headers=None):
+        self.status = status
+        self.headers = headers or {}
+        self._issues = list(issues)
+        
+    async def __aenter__(self):
+        return self
+        
+    async def __aexit__(self, *exc):
+        return False
+        
+    def raise_for_status(self):
+        if self.status >= 400:
+            raise aiohttp.ClientResponseError(mock.Mock(), (), status=self.status)
+            
+    async def json(self):
+        return {'issues': self._issues}
+
+
+class FakeSession:
+    """Hands out the given responses (or raises the given exceptions) in order"""
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.calls = 0
+        
+    def get(self, url, params=None):
+        self.calls += 1
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Delays the page fetcher waits out, without actually sleeping"""
+    waited = []
+    
+    async def sleep(delay):
+        waited.append(delay)
+        
+    monkeypatch.setattr(osmose_issues_loader.asyncio, 'sleep', sleep)
+    return waited
+
+
+def fetch_page(session):
+    loader = OsmoseIssuesLoader()
+    return asyncio.run(loader._fetch_page(session, 'https://example.invalid/issues', {}, 0))
+
+
+@needs_aiohttp
+def test_fetch_page_retries_throttling_and_server_errors(sleeps):
+    session = FakeSession(
+        FakeResponse(429, headers={'Retry-After': '3'}),
+        aiohttp.ServerDisconnectedError(),
+        FakeResponse(503),
+        FakeResponse(200, [{'id': 1}]),
+    )
+    
+    assert fetch_page(session) == [{'id': 1}]
+    assert session.calls == 4
+    assert sleeps == [3.0, 1.0, 2.0]
+
+
+@needs_aiohttp
+def test_fetch_page_gives_up_after_the_last_retry(sleeps):
+    session = FakeSession(*[FakeResponse(503)] * (osmose_issues_loader._RETRY_TOTAL + 1))
+    
+    with pytest.raises(aiohttp.ClientResponseError):
+        fetch_page(session)
+    assert len(sleeps) == osmose_issues_loader._RETRY_TOTAL
+
+
+@needs_aiohttp
+def test_fetch_page_does_not_retry_client_errors(sleeps):
+    session = FakeSession(FakeResponse(404))
+    
+    with pytest.raises(aiohttp.ClientResponseError):
+        fetch_page(session)
+    assert sleeps == []
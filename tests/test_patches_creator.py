@@ -0,0 +1,89 @@
+"""
+Tests for grid and cluster patch creation
+"""
+
+import os
+
+import pytest
+
+import patches_creator
+from patches_creator import PatchesCreator
+
+
+@pytest.fixture
+def creator(monkeypatch):
+    # Build grid patches in-process; worker processes only slow small inputs down
+    monkeypatch.setitem(patches_creator.PATCH_CONFIG, 'N_JOBS', 1)
+    return PatchesCreator()
+
+
+def make_errors(points):
+    return [{'error_id': f'e{i}', 'lon': lon, 'lat': lat} for i, (lon, lat) in enumerate(points)]
+
+
+def test_identical_errors_make_one_patch(creator):
+    patches = creator.create_patches_from_errors(make_errors([(70.0, 48.0)] * 5))
+    
+    assert len(patches) == 1
+    assert patches[0]['error_count'] == 5
+
+
+def test_collinear_errors_make_one_patch(creator):
+    errors = make_errors([(70.0 + i * 0.001, 48.0) for i in range(5)])
+    patches = creator.create_patches_from_errors(errors)
+    
+    assert len(patches) == 1
+    assert patches[0]['osmose_ids'] == sorted(e['error_id'] for e in errors)
+
+
+def test_separate_groups_get_their_own_patches(creator):
+    group_a = [(70.0 + i * 0.002, 48.0 + (i % 2) * 0.002) for i in range(6)]
+    group_b = [(71.0 + i * 0.002, 49.0 + (i % 2) * 0.002) for i in range(6)]
+    errors = make_errors(group_a + group_b)
+    patches = creator.create_patches_from_errors(errors)
+    
+    covered = set().union(*(patch['osmose_ids'] for patch in patches))
+    assert covered == {e['error_id'] for e in errors}
+    
+    # No two patches cover exactly the same errors
+    id_sets = [tuple(patch['osmose_ids']) for patch in patches]
+    assert len(id_sets) == len(set(id_sets))
+
+
+def test_patch_areas_stay_within_bounds(creator):
+    errors = make_errors([(70.0 + i * 0.01, 48.0 + (i % 3) * 0.01) for i in range(30)])
+    patches = creator.create_patches_from_errors(errors)
+    
+    assert patches
+    for patch in patches:
+        assert patches_creator.PATCH_CONFIG['MIN_PATCH_AREA_KM2'] <= patch['area_km2'] \
+            <= patches_creator.PATCH_CONFIG['MAX_PATCH_AREA_KM2']
+
+
+@pytest.fixture
+def worker_aliases(tmp_path, monkeypatch):
+    # Worker processes don't see conftest's sys.modules aliases, so give
+    # them importable config and utils modules that resolve to the same ones
+    for alias, module in (('config', 'config_file'), ('utils', 'utils_file')):
+        (tmp_path / f'{alias}.py').write_text(
+            f'import sys, {module}\nsys.modules[__name__] = {module}\n'
+        )
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.setenv('PYTHONPATH', os.pathsep.join(filter(None, [
+        str(tmp_path), os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        os.environ.get('PYTHONPATH'),
+    ])))
+
+
+def test_parallel_grid_patches_match_serial(creator, monkeypatch, worker_aliases):
+    errors = make_errors([(70.0 + (i % 20) * 0.02, 48.0 + (i // 20) * 0.02) for i in range(200)])
+    serial = creator.create_patches_from_errors(errors)
+    
+    monkeypatch.setitem(patches_creator.PATCH_CONFIG, 'N_JOBS', 2)
+    parallel = PatchesCreator().create_patches_from_errors(errors)
+    
+    def summary(patches):
+        return [(p['osmose_ids'], p['geometry'].wkt, p['area_km2']) for p in patches]
+    
+    assert len(serial) > 1
+    assert summary(parallel) == summary(serial)
@@ -0,0 +1,53 @@
+"""
+Tests for the polygon metric helpers
+"""
+
+import math
+
+import pytest
+from shapely.geometry import Point, Polygon, box
+
+import utils_file
+from utils_file import calculate_area_km2, polygon_metrics, scale_polygon
+
+
+@pytest.mark.parametrize('polygon', [
+    Point(70.0, 48.0).buffer(0.02, quad_segs=4),
+    box(70.0, 48.0, 70.05, 48.05),
+    # Holes don't count: area is the one enclosed by the exterior ring
+    Polygon(
+        [(70.0, 0.0), (71.0, 0.0), (71.0, 1.0), (70.0, 1.0)],
+        [[(70.2, 0.2), (70.4, 0.2), (70.4, 0.4), (70.2, 0.4)]]
+    ),
+    box(70.0, 45.0, 75.0, 50.0),
+])
+def test_calculate_area_matches_polygon_metrics(polygon):
+    assert calculate_area_km2(polygon) == polygon_metrics(polygon)['area_km2']
+
+
+def test_shoelace_without_pyproj(monkeypatch):
+    monkeypatch.setattr(utils_file, 'Transformer', None)
+    metrics = polygon_metrics(box(70.0, 48.0, 70.05, 48.05))
+    
+    assert not metrics['projected']
+    assert metrics['area_km2'] == pytest.approx(0.05 * 0.05 * 111.32 ** 2 * math.cos(math.radians(48.025)))
+
+
+def test_scaling_multiplies_shoelace_area_by_square_of_factor(monkeypatch):
+    monkeypatch.setattr(utils_file, 'Transformer', None)
+    polygon = Point(70.0, 48.0).buffer(0.02, quad_segs=4)
+    scaled = scale_polygon(polygon, 1.7)
+    
+    assert polygon_metrics(scaled)['area_km2'] == pytest.approx(
+        polygon_metrics(polygon)['area_km2'] * 1.7 ** 2
+    )
+
+
+@pytest.mark.skipif(utils_file.Transformer is None, reason="pyproj not installed")
+def test_patch_sized_polygons_are_projected(monkeypatch):
+    polygon = Point(70.0, 48.0).buffer(0.02, quad_segs=4)
+    metrics = polygon_metrics(polygon)
+    
+    assert metrics['projected']
+    monkeypatch.setattr(utils_file, 'Transformer', None)
+    assert metrics['area_km2'] == pytest.approx(polygon_metrics(polygon)['area_km2'], rel=0.01)
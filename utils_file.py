@@ -4,12 +4,56 @@ Shared utilities for Osmose processing pipeline
 """
 
 import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg2.extras import RealDictCursor, execute_values
+from psycopg2.pool import PoolError, ThreadedConnectionPool
 import logging
 import math
-from typing import Dict, Optional
+import threading
+import time
+from functools import lru_cache
+import numpy as np
+import shapely
+from typing import Dict, Iterator, Optional
+from uuid import uuid4
+from shapely import affinity
 from shapely.geometry import Polygon
-from config import DB_CONFIG, LOGGING_CONFIG
+from config import DB_CONFIG, POOL_CONFIG, LOGGING_CONFIG
+
+# The vectorized geometry functions (shapely.box, multipoints, prepare,
+# set_coordinates, STRtree predicates) only exist from shapely 2
+if int(shapely.__version__.split('.')[0]) < 2:
+    raise ImportError(f"shapely >= 2.0 is required (found {shapely.__version__})")
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+try:
+    from pyproj import Transformer
+except ImportError:
+    Transformer = None
+
+try:
+    # Built from _geom_kernels.pyx with: cythonize -i _geom_kernels.pyx
+    from _geom_kernels import area_perimeter_km
+except ImportError:
+    area_perimeter_km = None
+
+# Kilometres per degree of latitude; a degree of longitude is this times cos(lat)
+_KM_PER_DEG_LAT = 111.32
+
+# TCP keepalives so idle pooled connections are not dropped by NATs or
+# firewalls; any of these set in DB_CONFIG take precedence
+_KEEPALIVE_DEFAULTS = {
+    'keepalives': 1,
+    'keepalives_idle': 30,
+    'keepalives_interval': 10,
+    'keepalives_count': 5
+}
+
+_pool: Optional[ThreadedConnectionPool] = None
+_pool_lock = threading.Lock()
 
 def setup_logging():
     """Setup logging configuration"""
@@ -19,88 +63,278 @@ def setup_logging():
     )
     return logging.getLogger(__name__)
 
-def get_db_connection() -> psycopg2.extensions.connection:
-    """Get database connection"""
-    try:
-        conn = psycopg2.connect(**DB_CONFIG)
-        return conn
-    except Exception as e:
-        logging.error(f"Database connection failed: {e}")
-        raise
-
-def close_db_connection(conn: psycopg2.extensions.connection):
-    """Close database connection"""
+def get_db_pool() -> ThreadedConnectionPool:
+    """Get the process-wide connection pool, creating it on first use"""
+    global _pool
+    
+    with _pool_lock:
+        if _pool is None:
+            try:
+                _pool = ThreadedConnectionPool(
+                    POOL_CONFIG['MIN_CONNECTIONS'],
+                    POOL_CONFIG['MAX_CONNECTIONS'],
+                    **{**_KEEPALIVE_DEFAULTS, **DB_CONFIG}
+                )
+            except Exception as e:
+                logging.error(f"Database connection failed: {e}")
+                raise
+    return _pool
+
+def get_db_connection(pool: Optional[ThreadedConnectionPool] = None,
+                      wait: float = 0) -> psycopg2.extensions.connection:
+    """Get database connection from the pool, waiting up to wait seconds if it is exhausted"""
+    pool = pool or get_db_pool()
+    deadline = time.monotonic() + wait
+    while True:
+        try:
+            return pool.getconn()
+        except PoolError as e:
+            # ThreadedConnectionPool raises rather than blocks when every
+            # connection is checked out; poll until one is returned
+            if time.monotonic() < deadline:
+                time.sleep(0.05)
+                continue
+            logging.error(f"Database connection failed: {e}")
+            raise
+        except Exception as e:
+            logging.error(f"Database connection failed: {e}")
+            raise
+
+def close_db_connection(conn: psycopg2.extensions.connection,
+                        pool: Optional[ThreadedConnectionPool] = None):
+    """Return database connection to the pool"""
     if conn:
-        conn.close()
+        (pool or get_db_pool()).putconn(conn)
+
+def shutdown_pool():
+    """Close every pooled connection; the next get_db_pool() starts a new pool"""
+    global _pool
+    
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
+
+def ensure_batch_partition(cur):
+    """Create the default, current-month and next-month import_batches partitions if missing"""
+    # Computed server-side so the month matches the imported_at default.
+    # Rows for other months (backfills, clock skew) land in the DEFAULT
+    # partition; any already parked there for a month being created are moved
+    # into it before it is attached. Skipped on legacy, unpartitioned tables.
+    cur.execute("""
+        DO $$
+        DECLARE
+            month_start TIMESTAMP;
+            partition_name TEXT;
+        BEGIN
+            IF NOT EXISTS (
+                SELECT 1 FROM pg_partitioned_table
+                WHERE partrelid = 'import_batches'::regclass
+            ) THEN
+                RETURN;
+            END IF;
+            
+            CREATE TABLE IF NOT EXISTS import_batches_default
+                PARTITION OF import_batches DEFAULT;
+            
+            FOR month_start IN
+                SELECT generate_series(
+                    date_trunc('month', LOCALTIMESTAMP),
+                    date_trunc('month', LOCALTIMESTAMP) + INTERVAL '1 month',
+                    INTERVAL '1 month'
+                )
+            LOOP
+                partition_name := 'import_batches_' || to_char(month_start, 'YYYY_MM');
+                CONTINUE WHEN to_regclass(partition_name) IS NOT NULL;
+                
+                -- Serialize creators, then check again
+                LOCK TABLE import_batches IN SHARE UPDATE EXCLUSIVE MODE;
+                CONTINUE WHEN to_regclass(partition_name) IS NOT NULL;
+                
+                EXECUTE format(
+                    'CREATE TABLE %I (LIKE import_batches INCLUDING DEFAULTS)',
+                    partition_name
+                );
+                EXECUTE format(
+                    'WITH moved AS ('
+                    '    DELETE FROM import_batches_default'
+                    '    WHERE imported_at >= %L AND imported_at < %L'
+                    '    RETURNING *'
+                    ') INSERT INTO %I SELECT * FROM moved',
+                    month_start, month_start + INTERVAL '1 month', partition_name
+                );
+                EXECUTE format(
+                    'ALTER TABLE import_batches ATTACH PARTITION %I '
+                    'FOR VALUES FROM (%L) TO (%L)',
+                    partition_name, month_start, month_start + INTERVAL '1 month'
+                );
+            END LOOP;
+        END
+        $$;
+    """)
+
+def bulk_insert(conn: psycopg2.extensions.connection, sql: str, rows,
+                template: Optional[str] = None, page_size: int = 500,
+                fetch: bool = False) -> list:
+    """Insert rows in pages with execute_values; sql holds one %s for the VALUES list"""
+    # One statement per page_size rows instead of one per row. With fetch,
+    # the RETURNING rows of every page are collected. The caller commits.
+    with conn.cursor() as cur:
+        returned = execute_values(
+            cur, sql, rows,
+            template=template,
+            page_size=page_size,
+            fetch=fetch
+        )
+    return returned or []
+
+def upload_metrics(conn: psycopg2.extensions.connection, rows, page_size: int = 500) -> int:
+    """Update patch area, perimeter, priority and difficulty from
+    (patch_id, area_km2, perimeter_km, priority, difficulty) rows; returns rows updated"""
+    # One UPDATE ... FROM (VALUES ...) per page_size rows. The caller commits.
+    with conn.cursor() as cur:
+        updated = execute_values(cur, """
+            UPDATE osmose_patches AS p
+            SET area_km2 = v.area_km2,
+                perimeter_km = v.perimeter_km,
+                priority = v.priority,
+                difficulty = v.difficulty
+            FROM (VALUES %s) AS v(patch_id, area_km2, perimeter_km, priority, difficulty)
+            WHERE p.patch_id = v.patch_id
+            RETURNING p.patch_id
+        """, rows,
+            template='(%s, %s::double precision, %s::double precision, %s::integer, %s)',
+            page_size=page_size,
+            fetch=True
+        )
+    return len(updated)
+
+def stream_query(conn: psycopg2.extensions.connection, sql: str, params=None,
+                 batch: int = 10000) -> Iterator[tuple]:
+    """Stream query rows as tuples through a server-side cursor, batch rows per fetch"""
+    with conn.cursor(name=f'stream_{uuid4().hex}') as cur:
+        cur.itersize = batch
+        cur.execute(sql, params)
+        yield from cur
 
 def km_to_degrees(km: float, latitude: float) -> float:
     """Convert kilometers to degrees at given latitude"""
+    # 0.01 degree latitude buckets shift the result by well under 0.1%
+    return _km_to_degrees_cached(round(km, 6), round(latitude, 2))
+
+@lru_cache(maxsize=4096)
+def _km_to_degrees_cached(km: float, latitude: float) -> float:
     lat_radians = math.radians(latitude)
-    km_per_degree_lat = 111.32
-    km_per_degree_lon = 111.32 * math.cos(lat_radians)
+    km_per_degree_lat = _KM_PER_DEG_LAT
+    km_per_degree_lon = _KM_PER_DEG_LAT * math.cos(lat_radians)
     
     return km / ((km_per_degree_lat + km_per_degree_lon) / 2)
 
-def calculate_area_km2(polygon: Polygon) -> float:
-    """Calculate polygon area in square kilometers"""
-    centroid = polygon.centroid
-    lat = centroid.y
-    
-    coords = list(polygon.exterior.coords)
-    area = 0.0
+if njit is not None:
+    # Fused single-pass kernels: no temporaries for the diffs and products
+    @njit(cache=True, fastmath=True)
+    def _area_km2(x, y, lat):
+        lat_factor = _KM_PER_DEG_LAT
+        lon_factor = _KM_PER_DEG_LAT * math.cos(math.radians(lat))
+        x0 = x[0]
+        y0 = y[0]
+        s = 0.0
+        for i in range(x.size - 1):
+            s += (x[i] - x0) * (y[i + 1] - y0) - (x[i + 1] - x0) * (y[i] - y0)
+        return 0.5 * abs(s) * lat_factor * lon_factor
+
+    @njit(cache=True, fastmath=True)
+    def _perimeter_km(x, y, lat):
+        lat_factor = _KM_PER_DEG_LAT
+        lon_factor = _KM_PER_DEG_LAT * math.cos(math.radians(lat))
+        total = 0.0
+        for i in range(x.size - 1):
+            dx = (x[i + 1] - x[i]) * lon_factor
+            dy = (y[i + 1] - y[i]) * lat_factor
+            total += math.sqrt(dx * dx + dy * dy)
+        return total
+else:
+    _area_km2 = None
+    _perimeter_km = None
+
+def polygon_metrics(polygon: Polygon, lat: Optional[float] = None, *,
+                    src_epsg: int = 4326, dst_epsg: int = 6933) -> Dict:
+    """Calculate exterior-ring area and perimeter in km from one pass over the ring"""
+    coords = np.asarray(polygon.exterior.coords)
+    # A caller that already has the centroid passes its latitude as lat; it sets
+    # the shoelace and perimeter scaling and is not needed for projected areas
+    if lat is None:
+        lat = polygon.centroid.y
     
-    for i in range(len(coords) - 1):
-        x1, y1 = coords[i]
-        x2, y2 = coords[i + 1]
-        
-        lat_factor = 111.32  
-        lon_factor = 111.32 * math.cos(math.radians(lat))  
+    if area_perimeter_km is not None:
+        area, perimeter = area_perimeter_km(np.ascontiguousarray(coords, dtype=np.float64), lat)
+    elif _area_km2 is not None:
+        x, y = coords[:, 0], coords[:, 1]
+        area = float(_area_km2(x, y, lat))
+        perimeter = float(_perimeter_km(x, y, lat))
+    else:
+        lat_factor = _KM_PER_DEG_LAT
+        lon_factor = _KM_PER_DEG_LAT * math.cos(math.radians(lat))
         
-        x1_km = x1 * lon_factor
-        y1_km = y1 * lat_factor
-        x2_km = x2 * lon_factor
-        y2_km = y2 * lat_factor
+        # Shoelace over the whole ring at once; shifting to the first vertex
+        # leaves the area unchanged but avoids cancellation at large coordinates
+        x = coords[:, 0] - coords[0, 0]
+        y = coords[:, 1] - coords[0, 1]
+        area = float(abs(np.dot(x[:-1], y[1:]) - np.dot(x[1:], y[:-1])) / 2.0 * lon_factor * lat_factor)
         
-        area += (x1_km * y2_km - x2_km * y1_km)
+        dx = np.diff(x) * lon_factor
+        dy = np.diff(y) * lat_factor
+        perimeter = float(np.hypot(dx, dy).sum())
+    
+    # With pyproj installed the area is measured in an equal-area projection,
+    # which stays exact where a single cos(lat) does not; the perimeter keeps
+    # the cosine scaling either way
+    projected = Transformer is not None
+    if projected:
+        area = _projected_area_km2(coords, src_epsg, dst_epsg)
     
-    return abs(area) / 2.0
+    return {'area_km2': area, 'perimeter_km': perimeter, 'projected': projected}
+
+@lru_cache(maxsize=None)
+def _transformer(src_epsg: int, dst_epsg: int):
+    return Transformer.from_crs(src_epsg, dst_epsg, always_xy=True)
+
+def _projected_area_km2(coords: np.ndarray, src_epsg: int, dst_epsg: int) -> float:
+    """Shoelace area of a ring after projecting it to an equal-area CRS"""
+    x, y = _transformer(src_epsg, dst_epsg).transform(coords[:, 0], coords[:, 1])
+    x = np.asarray(x) - x[0]
+    y = np.asarray(y) - y[0]
+    return float(abs(np.dot(x[:-1], y[1:]) - np.dot(x[1:], y[:-1])) / 2.0 / 1e6)
 
-def calculate_perimeter_km(polygon: Polygon) -> float:
+def calculate_area_km2(polygon: Polygon, lat: Optional[float] = None, *,
+                       src_epsg: int = 4326, dst_epsg: int = 6933) -> float:
+    """Calculate polygon area in square kilometers"""
+    # As in polygon_metrics, lat only sets the shoelace's cos(lat) scaling;
+    # projected areas don't use it
+    return polygon_metrics(polygon, lat, src_epsg=src_epsg, dst_epsg=dst_epsg)['area_km2']
+
+def calculate_perimeter_km(polygon: Polygon, lat: Optional[float] = None) -> float:
     """Calculate polygon perimeter in kilometers"""
-    coords = list(polygon.exterior.coords)
-    perimeter = 0.0
-    lat = polygon.centroid.y
-    
-    lat_factor = 111.32  
-    lon_factor = 111.32 * math.cos(math.radians(lat))  
-    
-    for i in range(len(coords) - 1):
-        dx = (coords[i+1][0] - coords[i][0]) * lon_factor
-        dy = (coords[i+1][1] - coords[i][1]) * lat_factor
-        perimeter += math.sqrt(dx**2 + dy**2)
-        
-    return perimeter
+    return polygon_metrics(polygon, lat)['perimeter_km']
 
-def scale_polygon(polygon: Polygon, factor: float) -> Polygon:
+def scale_polygon(polygon: Polygon, factor: float, centroid=None) -> Polygon:
     """Scale polygon by given factor around its centroid"""
-    centroid = polygon.centroid
-    
-    coords = list(polygon.exterior.coords)
+    return affinity.scale(
+        polygon, xfact=factor, yfact=factor,
+        origin=centroid if centroid is not None else 'centroid'
+    )
+
+def scale_polygons(polygons, factors) -> np.ndarray:
+    """Scale many polygons, each around its own centroid, in vectorized calls"""
+    polygons = np.array(polygons, dtype=object)
+    factors = np.broadcast_to(np.asarray(factors, dtype=np.float64), polygons.shape)
     
-    scaled_coords = []
-    for x, y in coords:
-        x_translated = x - centroid.x
-        y_translated = y - centroid.y
-        
-        x_scaled = x_translated * factor
-        y_scaled = y_translated * factor
-        
-        x_final = x_scaled + centroid.x
-        y_final = y_scaled + centroid.y
-        
-        scaled_coords.append((x_final, y_final))
+    # Every ring's coordinates in one flat array, tagged with their polygon
+    coords, index = shapely.get_coordinates(polygons, return_index=True)
+    centroids = shapely.get_coordinates(shapely.centroid(polygons))[index]
+    scaled = (coords - centroids) * factors[index, None] + centroids
     
-    return Polygon(scaled_coords)
+    return shapely.set_coordinates(polygons, scaled)
 
 def calculate_priority(error_count: int, area_km2: float) -> int:
     """Calculate patch priority based on error density"""
@@ -122,4 +356,24 @@ def calculate_difficulty(area_km2: float, error_count: int) -> str:
     elif area_km2 > 15 or error_count > 15:
         return 'medium'
     else:
-        return 'easy'
\ No newline at end of file
+        return 'easy'
+
+# Density thresholds and the priority each band maps to, as in calculate_priority
+_PRIORITY_THRESHOLDS = np.array([1.0, 3.0, 5.0])
+_PRIORITY_LEVELS = np.array([3, 5, 7, 9])
+
+def calculate_priority_batch(error_counts, areas_km2) -> np.ndarray:
+    """Calculate priorities for arrays of patch error counts and areas"""
+    error_density = np.asarray(error_counts) / np.maximum(areas_km2, 1)
+    # side='left' counts thresholds strictly below the density, matching '>'
+    return _PRIORITY_LEVELS[np.searchsorted(_PRIORITY_THRESHOLDS, error_density, side='left')]
+
+def calculate_difficulty_batch(areas_km2, error_counts) -> np.ndarray:
+    """Calculate difficulties for arrays of patch areas and error counts"""
+    areas_km2 = np.asarray(areas_km2)
+    error_counts = np.asarray(error_counts)
+    return np.select(
+        [(areas_km2 > 25) | (error_counts > 30), (areas_km2 > 15) | (error_counts > 15)],
+        ['hard', 'medium'],
+        default='easy'
+    )